@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from io import StringIO
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import database
+
+#benchmark appends per second for the old JSON file store vs the ring buffer store
+
+COLUMNS = database.COLUMNS
+N_LEGACY = 300
+N_RING = 100000
+
+# copy of the old read-modify-write file store
+LEGACY_FILE = os.path.join(tempfile.mkdtemp(), "legacy_sensor_data.json")
+_lock = threading.Lock()
+
+def legacy_open_file():
+    if not os.path.exists(LEGACY_FILE):
+        return pd.DataFrame(columns=COLUMNS)
+    with open(LEGACY_FILE, 'r') as f:
+        content = f.read()
+    if not content or content == '[]':
+        return pd.DataFrame(columns=COLUMNS)
+    df = pd.read_json(StringIO(content), convert_dates=['timestamp'])
+    if not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df
+
+def legacy_add_data(data_dict):
+    with _lock:
+        df = legacy_open_file()
+        new_row = pd.DataFrame([data_dict])
+        df = pd.concat([df, new_row], ignore_index=True)
+        df = database.group_by_timestamp(df)
+        if len(df) > 100:
+            df = df.tail(100)
+        with open(LEGACY_FILE, 'w') as f:
+            df.to_json(f, date_format='iso', orient='records')
+
+def make_rows(n):
+    start = datetime.now() - timedelta(seconds=n / 10)
+    rows = []
+    for i in range(n):
+        row = {'timestamp': (start + timedelta(seconds=i / 10)).isoformat()}
+        for col in COLUMNS[1:]:
+            row[col] = float(np.random.rand())
+        rows.append(row)
+    return rows
+
+def bench(name, add, rows):
+    t0 = time.perf_counter()
+    for row in rows:
+        add(row)
+    elapsed = time.perf_counter() - t0
+    print(f"{name:<22}{len(rows):>8} appends {elapsed:8.3f} s {len(rows) / elapsed:>12.0f} appends/s")
+    return len(rows) / elapsed
+
+def bench_batches(name, rows, batch_size=50):
+    timestamps = np.array([np.datetime64(row['timestamp'], 'ns') for row in rows])
+    columns = {col: np.array([row[col] for row in rows]) for col in COLUMNS[1:]}
+    t0 = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        database.add_batch(timestamps[i:i + batch_size],
+                           {col: values[i:i + batch_size] for col, values in columns.items()})
+    elapsed = time.perf_counter() - t0
+    print(f"{name:<22}{len(rows):>8} rows    {elapsed:8.3f} s {len(rows) / elapsed:>12.0f} rows/s")
+
+if __name__ == "__main__":
+    legacy = bench("legacy JSON file", legacy_add_data, make_rows(N_LEGACY))
+    ring = bench("add_data", database.add_data, make_rows(N_RING))
+    print(f"speedup: {ring / legacy:.0f}x")
+    bench_batches("add_batch (50 rows)", make_rows(N_RING))
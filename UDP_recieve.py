@@ -1,43 +1,288 @@
 import socket
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import select
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from data_process import handle_json_data, handle_audio_data
-from div import log_setup, log
+from div import log
 
-def udp_start_json_socket():
+AUDIO_RCVBUF = 4 * 1024 * 1024 # kernel receive buffer for the audio port (bytes)
+MAX_DATAGRAM_SIZE = 4096 # largest datagram accepted on the audio port
+MAX_JSON_DATAGRAM_SIZE = 65535 # largest UDP datagram, sensor packets may use all of it
+AUDIO_BATCH_SIZE = 64 # datagrams drained per wakeup in batched mode
+AUDIO_BATCH_RECEIVE = True # use AudioBatchReceiver instead of the asyncio receiver for audio
+
+def udp_start_json_socket(reuse_port=False):
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) #IPv4,  User Datagram Protocol
     server_address =("0.0.0.0", 6002) #all ip's, port 6002
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) ## if already bound
+    if reuse_port: # several processes bind the port, the kernel spreads senders over them
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     log(f"Binding to UDP port {server_address[1]} to receive JSON data")
     sock.bind(server_address)
     return sock, server_address
 
-def udp_start_audio_socket():
+def udp_start_audio_socket(rcvbuf=AUDIO_RCVBUF, reuse_port=False):
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    server_address =("0.0.0.0", 6001) #all ip's, port 6002
+    server_address =("0.0.0.0", 6001) #all ip's, port 6001
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) ## if already bound
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf) # capped by net.core.rmem_max
+        log(f"Audio socket receive buffer: {sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)} bytes")
     log(f"Binding to UDP port {server_address[1]} to receive Audio data")
     sock.bind(server_address)
     return sock, server_address
 
-def UDP_main_json():
-    sock_json, server_adress_json = udp_start_json_socket()
+MAX_PENDING = 256 # datagrams waiting for the handler before new ones are dropped
 
-    log_setup()
-    while True:
-        try:
-            json_data, address_json = sock_json.recvfrom(4096)
-            #log(f"Received packet from {address[0]}:{address[1]}")
-            #log(json_data)
-            handle_json_data(json_data, address_json)
-        except Exception as e:
-            log(f"Error in UDP receiver: {str(e)}")
+class UDPReceiver(asyncio.DatagramProtocol):
+    """
+    Datagram receiver running on the asyncio event loop.
+
+    Parsing and storing is handed to a single worker thread so packets are
+    handled in order without blocking the loop. When the worker falls more
+    than max_pending datagrams behind, new datagrams are dropped and counted.
+    """
+    def __init__(self, name, handler, max_pending=MAX_PENDING):
+        self.name = name
+        self.handler = handler
+        self.max_pending = max_pending
+        self.received = 0
+        self.dropped = 0
+        self.errors = 0
+        self.transport = None
+        self._pending = 0
+        self._loop = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
 
-def UDP_main_audio():
-    sock_audio, server_adress_audio = udp_start_audio_socket()
-    while True:
+    def connection_made(self, transport):
+        self.transport = transport
+        self._loop = asyncio.get_running_loop()
+
+    def datagram_received(self, data, address):
+        self.received += 1
+        if self._pending >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending += 1
+        future = self._loop.run_in_executor(self._executor, self._handle, data, address)
+        future.add_done_callback(self._handled)
+
+    def _handle(self, data, address):
         try:
-            audio_data, address_audio = sock_audio.recvfrom(4096)
-            #log(f"Received packet from {address_audio[0]}:{address_audio[1]}")
-            #log(audio_data)
-            handle_audio_data(audio_data, address_audio)
+            self.handler(data, address)
         except Exception as e:
-            log(f"Error in UDP receiver: {str(e)}")
\ No newline at end of file
+            self.errors += 1
+            log(f"Error in UDP receiver {self.name}: {str(e)}")
+
+    def _handled(self, future):
+        self._pending -= 1
+
+    def error_received(self, exc):
+        log(f"Socket error in UDP receiver {self.name}: {str(exc)}")
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "pending": self._pending
+        }
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# recvmmsg(2) structures, used to read a batch of datagrams in one syscall
+class _iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p),
+                ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_iovec)),
+                ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p),
+                ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _msghdr), ("msg_len", ctypes.c_uint)]
+
+_SOCKADDR_SIZE = 16 # sizeof(struct sockaddr_in)
+_MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0x40)
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    _recvmmsg = _libc.recvmmsg
+    _recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    _recvmmsg.restype = ctypes.c_int
+except (OSError, AttributeError, TypeError):
+    _recvmmsg = None
+
+def kernel_drop_count(sock):
+    """Datagrams the kernel dropped for this socket (Linux /proc/net/udp), None if unknown"""
+    try:
+        inode = str(os.fstat(sock.fileno()).st_ino)
+        for table in ("/proc/net/udp", "/proc/net/udp6"):
+            if not os.path.exists(table):
+                continue
+            with open(table) as f:
+                next(f) # header
+                for line in f:
+                    fields = line.split()
+                    if fields[9] == inode:
+                        return int(fields[-1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+class AudioBatchReceiver:
+    """
+    High-throughput receive loop for the audio port.
+
+    Each wakeup drains up to batch_size datagrams into a preallocated buffer
+    pool, using recvmmsg where the C library provides it and a non-blocking
+    recvfrom_into loop otherwise. The handler gets a memoryview into the pool
+    which is only valid until it returns, so it must copy what it keeps.
+    """
+    def __init__(self, sock, handler, name="udp-audio", batch_size=AUDIO_BATCH_SIZE,
+                 max_datagram_size=MAX_DATAGRAM_SIZE):
+        self.sock = sock
+        self.handler = handler
+        self.name = name
+        self.batch_size = batch_size
+        self.max_datagram_size = max_datagram_size
+        self.received = 0
+        self.truncated = 0
+        self.errors = 0
+        self.wakeups = 0
+        self._pool = bytearray(batch_size * max_datagram_size)
+        self._view = memoryview(self._pool)
+        self._stop = threading.Event()
+        self._thread = None
+        self._drops_at_start = kernel_drop_count(sock) or 0
+        sock.setblocking(False)
+        self._msgs = None
+        if _recvmmsg is not None:
+            self._setup_recvmmsg()
+
+    def _setup_recvmmsg(self):
+        n = self.batch_size
+        pool_address = ctypes.addressof(ctypes.c_char.from_buffer(self._pool))
+        self._names = ctypes.create_string_buffer(n * _SOCKADDR_SIZE)
+        names_address = ctypes.addressof(self._names)
+        self._iovecs = (_iovec * n)()
+        self._msgs = (_mmsghdr * n)()
+        for i in range(n):
+            self._iovecs[i].iov_base = pool_address + i * self.max_datagram_size
+            self._iovecs[i].iov_len = self.max_datagram_size
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = names_address + i * _SOCKADDR_SIZE
+            hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            hdr.msg_iovlen = 1
+
+    def _receive_batch(self):
+        """Fill the pool, returns a list of (length, address) per slot used"""
+        if self._msgs is not None:
+            for i in range(self.batch_size):
+                self._msgs[i].msg_hdr.msg_namelen = _SOCKADDR_SIZE
+            count = _recvmmsg(self.sock.fileno(), self._msgs, self.batch_size, _MSG_DONTWAIT, None)
+            if count < 0:
+                err = ctypes.get_errno()
+                if err in (11, 35): # EAGAIN / EWOULDBLOCK
+                    return []
+                raise OSError(err, os.strerror(err))
+            batch = []
+            for i in range(count):
+                msg = self._msgs[i]
+                if msg.msg_hdr.msg_flags & getattr(socket, "MSG_TRUNC", 0x20):
+                    self.truncated += 1
+                batch.append((msg.msg_len, self._parse_address(i)))
+            return batch
+        batch = []
+        size = self.max_datagram_size
+        for i in range(self.batch_size):
+            try:
+                length, address = self.sock.recvfrom_into(self._view[i * size:(i + 1) * size])
+            except (BlockingIOError, InterruptedError):
+                break
+            batch.append((length, address))
+        return batch
+
+    def _parse_address(self, i):
+        raw = self._names.raw[i * _SOCKADDR_SIZE:(i + 1) * _SOCKADDR_SIZE]
+        return socket.inet_ntoa(raw[4:8]), int.from_bytes(raw[2:4], "big")
+
+    def drain(self):
+        """Read and handle datagrams until the socket queue is empty"""
+        self.wakeups += 1
+        size = self.max_datagram_size
+        while True:
+            batch = self._receive_batch()
+            for i, (length, address) in enumerate(batch):
+                self.received += 1
+                try:
+                    self.handler(self._view[i * size:i * size + length], address)
+                except Exception as e:
+                    self.errors += 1
+                    log(f"Error in UDP receiver {self.name}: {str(e)}")
+            if len(batch) < self.batch_size:
+                return
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                readable, _, _ = select.select([self.sock], [], [], 0.5)
+                if readable:
+                    self.drain()
+            except Exception as e:
+                self.errors += 1
+                log(f"Error in UDP receiver {self.name}: {str(e)}")
+
+    def start(self):
+        mode = "recvmmsg" if self._msgs is not None else "non-blocking recvfrom_into"
+        log(f"Starting batched audio receiver ({mode}, {self.batch_size} x {self.max_datagram_size} bytes)")
+        self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stats(self):
+        drops = kernel_drop_count(self.sock)
+        return {
+            "received": self.received,
+            "dropped": None if drops is None else drops - self._drops_at_start,
+            "truncated": self.truncated,
+            "errors": self.errors,
+            "wakeups": self.wakeups
+        }
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self.sock.close()
+
+async def start_udp_receivers(batched_audio=AUDIO_BATCH_RECEIVE):
+    """Bind the JSON and audio ports on the running event loop"""
+    loop = asyncio.get_running_loop()
+    receivers = []
+    sockets = [(udp_start_json_socket, "udp-json", handle_json_data)]
+    if batched_audio:
+        sock, server_address = udp_start_audio_socket()
+        receivers.append(AudioBatchReceiver(sock, handle_audio_data).start())
+    else:
+        sockets.append((udp_start_audio_socket, "udp-audio", handle_audio_data))
+    for start_socket, name, handler in sockets:
+        sock, server_address = start_socket()
+        sock.setblocking(False)
+        _, receiver = await loop.create_datagram_endpoint(
+            lambda name=name, handler=handler: UDPReceiver(name, handler), sock=sock)
+        receivers.append(receiver)
+    return receivers
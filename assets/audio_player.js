@@ -0,0 +1,151 @@
+// Live audio for the Acoustics card, plays the /ws/audio stream (see live.AudioStreamer).
+// Dash loads every script in assets/ automatically; the buttons are rendered later,
+// so clicks are picked up through the document.
+(function () {
+    var HEADER_BYTES = 8; // seq uint32, predictor int16, step index uint8, codec uint8
+    var LEAD_SECONDS = 0.15; // playout delay, absorbs network jitter
+
+    var STEP_TABLE = [
+        7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+        50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+        253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+        1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+        3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+        11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+        32767
+    ];
+    var INDEX_TABLE = [-1, -1, -1, -1, 2, 4, 6, 8, -1, -1, -1, -1, 2, 4, 6, 8];
+
+    var socket = null;
+    var context = null;
+    var sampleRate = 32018;
+    var nextTime = 0;
+    var paused = false;
+
+    function setStatus(text) {
+        var status = document.getElementById("audio_player_status");
+        if (status) {
+            status.textContent = text;
+        }
+    }
+
+    function decodeAdpcm(view, predictor, index) {
+        var out = new Float32Array((view.byteLength - HEADER_BYTES) * 2);
+        for (var i = 0; i < out.length; i++) {
+            var byte = view.getUint8(HEADER_BYTES + (i >> 1));
+            var code = (i & 1) ? byte & 0x0f : byte >> 4; // high nibble first
+            var step = STEP_TABLE[index];
+            var diff = step >> 3;
+            if (code & 4) diff += step;
+            if (code & 2) diff += step >> 1;
+            if (code & 1) diff += step >> 2;
+            predictor += (code & 8) ? -diff : diff;
+            predictor = Math.max(-32768, Math.min(32767, predictor));
+            index = Math.max(0, Math.min(88, index + INDEX_TABLE[code]));
+            out[i] = predictor / 32768;
+        }
+        return out;
+    }
+
+    function decodePcm(view) {
+        var out = new Float32Array((view.byteLength - HEADER_BYTES) / 2);
+        for (var i = 0; i < out.length; i++) {
+            out[i] = view.getInt16(HEADER_BYTES + 2 * i, true) / 32768;
+        }
+        return out;
+    }
+
+    function playFrame(data) {
+        if (paused || !context) {
+            return;
+        }
+        var view = new DataView(data);
+        var codec = view.getUint8(7);
+        var samples = codec === 1 ? decodeAdpcm(view, view.getInt16(4, true), view.getUint8(6)) : decodePcm(view);
+        var buffer = context.createBuffer(1, samples.length, sampleRate);
+        buffer.copyToChannel(samples, 0);
+        var source = context.createBufferSource();
+        source.buffer = buffer;
+        source.connect(context.destination);
+        if (nextTime < context.currentTime) { // underrun, restart with a fresh lead
+            nextTime = context.currentTime + LEAD_SECONDS;
+        }
+        source.start(nextTime);
+        nextTime += buffer.duration;
+    }
+
+    function play() {
+        paused = false;
+        if (!context) {
+            context = new (window.AudioContext || window.webkitAudioContext)();
+        }
+        context.resume();
+        if (socket) {
+            setStatus("Playing live audio");
+            return;
+        }
+        var scheme = window.location.protocol === "https:" ? "wss://" : "ws://";
+        var url = scheme + window.location.host + "/ws/audio?codec=adpcm";
+        var device = document.getElementById("audio_player_device"); // device picked in the dropdown
+        if (device && device.textContent) {
+            url += "&device=" + encodeURIComponent(device.textContent);
+        }
+        var closeStatus = "Live audio stopped";
+        socket = new WebSocket(url);
+        socket.binaryType = "arraybuffer";
+        socket.onmessage = function (event) {
+            if (typeof event.data === "string") { // stream description comes first
+                var info = JSON.parse(event.data);
+                if (info.error) {
+                    closeStatus = info.error; // the server closes the socket next
+                    return;
+                }
+                sampleRate = info.sample_rate;
+                return;
+            }
+            playFrame(event.data);
+        };
+        socket.onclose = function () {
+            socket = null;
+            setStatus(closeStatus);
+        };
+        setStatus("Playing live audio");
+    }
+
+    function pause() {
+        paused = true;
+        nextTime = 0;
+        if (context) {
+            context.suspend();
+        }
+        setStatus("Live audio paused");
+    }
+
+    function stop() {
+        paused = false;
+        nextTime = 0;
+        if (socket) {
+            socket.close();
+            socket = null;
+        }
+        if (context) {
+            context.close();
+            context = null;
+        }
+        setStatus("Live audio stopped");
+    }
+
+    document.addEventListener("click", function (event) {
+        var button = event.target.closest("button");
+        if (!button) {
+            return;
+        }
+        if (button.id === "audio_play") {
+            play();
+        } else if (button.id === "audio_pause") {
+            pause();
+        } else if (button.id === "audio_stop") {
+            stop();
+        }
+    });
+})();
@@ -0,0 +1,235 @@
+import numpy as np
+
+class AudioRing:
+    """
+    Fixed-size int16 ring buffer for the audio stream.
+
+    Positions are absolute sample counts since start (`total` is the next
+    position to be written), so readers can ask for a range and get back
+    views into the ring without copying. The samples are allocated by the
+    first write, so devices that never send audio cost nothing.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._samples = None # allocated by the first write
+        self._head = 0 # next slot to write
+        self.total = 0 # samples written since start
+
+    def write(self, chunk):
+        """Copy a chunk of int16 bytes or samples into the ring, returns the number of samples"""
+        samples = chunk if isinstance(chunk, np.ndarray) else np.frombuffer(chunk, dtype=np.int16, count=len(chunk) // 2)
+        if self._samples is None:
+            self._samples = np.zeros(self.capacity, dtype=np.int16)
+        n = len(samples)
+        if n > self.capacity:
+            self._head = (self._head + n - self.capacity) % self.capacity
+            self.total += n - self.capacity
+            samples = samples[-self.capacity:]
+            n = self.capacity
+        first = min(n, self.capacity - self._head)
+        self._samples[self._head:self._head + first] = samples[:first]
+        self._samples[:n - first] = samples[first:]
+        self._head = (self._head + n) % self.capacity
+        self.total += n
+        return n
+
+    def oldest(self):
+        """Absolute position of the oldest sample still held"""
+        return max(self.total - self.capacity, 0)
+
+    def segments(self, start, end):
+        """Views covering absolute positions [start, end), at most two when the range wraps"""
+        start = max(start, self.oldest())
+        end = min(end, self.total)
+        if end <= start:
+            return []
+        first = start % self.capacity
+        last = first + (end - start)
+        if last <= self.capacity:
+            return [self._samples[first:last]]
+        return [self._samples[first:], self._samples[:last - self.capacity]]
+
+    def latest(self, n):
+        """Views covering the newest n samples"""
+        return self.segments(self.total - n, self.total)
+
+SEQ_MODULO = 2**32 # audio sequence numbers are uint32
+
+class AudioReorderBuffer:
+    """
+    Puts sequence-numbered audio packets back in order before they reach the ring.
+
+    Packets are held until the gap in front of them is filled or until
+    `window` newer packets have arrived, then the missing packets are given
+    up on and replaced with the same number of samples, either silence or a
+    straight line between the neighbouring samples, so everything after a
+    loss stays on the right sample position. Late packets (their slot was
+    already concealed) and duplicates are dropped. A jump of more than
+    `max_gap` packets, e.g. after a board reboot, restarts the sequence.
+    """
+    def __init__(self, window=4, conceal="interpolate", max_gap=1000):
+        self.window = window
+        self.conceal = conceal
+        self.max_gap = max_gap
+        self.received = 0
+        self.lost = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.late = 0
+        self.resyncs = 0
+        self._next = None # next sequence number to release
+        self._newest = None
+        self._pending = {} # seq -> samples waiting for the gap in front of them
+        self._frame = 0 # samples per packet, for the concealment length
+        self._last_sample = 0
+
+    def push(self, seq, samples):
+        """
+        Feed one packet.
+
+        Returns:
+            List of int16 arrays to append to the stream in order, may be empty
+        """
+        self.received += 1
+        if self._next is None:
+            self._next = self._newest = seq
+        ahead = (seq - self._next) % SEQ_MODULO
+        if ahead >= SEQ_MODULO // 2: # behind the release point
+            if (self._next - seq) % SEQ_MODULO > self.max_gap:
+                return self._resync(seq, samples)
+            self.late += 1 # includes duplicates of released packets, which can't be told apart
+            return []
+        if ahead > self.max_gap:
+            return self._resync(seq, samples)
+        if seq in self._pending:
+            self.duplicates += 1
+            return []
+        if (seq - self._newest) % SEQ_MODULO >= SEQ_MODULO // 2:
+            self.reordered += 1 # fills a hole behind the newest packet
+        else:
+            self._newest = seq
+        self._frame = len(samples)
+        self._pending[seq] = samples.copy() if seq != self._next else samples # may be a receive buffer
+        return self._release()
+
+    def _release(self):
+        out = []
+        while True:
+            while self._next in self._pending:
+                samples = self._pending.pop(self._next)
+                out.append(samples)
+                if len(samples):
+                    self._last_sample = int(samples[-1])
+                self._next = (self._next + 1) % SEQ_MODULO
+            if not self._pending or (self._newest - self._next) % SEQ_MODULO < self.window:
+                return out
+            missing = min((seq - self._next) % SEQ_MODULO for seq in self._pending)
+            following = self._pending[(self._next + missing) % SEQ_MODULO]
+            out.append(self._concealment(missing * self._frame, following))
+            self.lost += missing
+            self._next = (self._next + missing) % SEQ_MODULO
+
+    def _concealment(self, n, following):
+        if self.conceal != "interpolate" or len(following) == 0:
+            return np.zeros(n, dtype=np.int16)
+        ramp = np.linspace(self._last_sample, int(following[0]), n + 2)[1:-1]
+        return np.round(ramp).astype(np.int16)
+
+    def _resync(self, seq, samples):
+        """Release what is held and start over at seq"""
+        self.resyncs += 1
+        out = [self._pending[key] for key in sorted(self._pending, key=lambda key: (key - self._next) % SEQ_MODULO)]
+        self._pending = {}
+        self._next = (seq + 1) % SEQ_MODULO
+        self._newest = seq
+        self._frame = len(samples)
+        out.append(samples)
+        if len(samples):
+            self._last_sample = int(samples[-1])
+        return out
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "lost": self.lost,
+            "reordered": self.reordered,
+            "duplicates": self.duplicates,
+            "late": self.late,
+            "resyncs": self.resyncs,
+            "held": len(self._pending)
+        }
+
+FULL_SCALE = 2**15 - 1
+SILENCE_DB = -60.0 # reported for (near) digital silence
+
+def level_db(mean_square):
+    """dBFS level of an array of mean squares"""
+    mean_square = np.asarray(mean_square, dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        db = 10 * np.log10(mean_square / FULL_SCALE**2)
+    return np.where(mean_square < 1e-20, SILENCE_DB, db)
+
+class LoudnessMeter:
+    """
+    Streaming loudness over every sample of the audio stream.
+
+    Samples are summed into hops of hop_seconds. Each completed hop reports
+    its peak and Leq (energy average over the hop) plus the RMS level over a
+    sliding window of the last window_seconds, built from the stored hop
+    energies so the cost per sample is constant.
+    """
+    def __init__(self, sample_rate, window_seconds=1.0, hop_seconds=0.25):
+        self.sample_rate = sample_rate
+        self.hop = max(1, int(round(sample_rate * hop_seconds)))
+        self.hops_per_window = max(1, int(round(window_seconds / hop_seconds)))
+        self._hop_energy = np.zeros(self.hops_per_window) # sums of squares, circular
+        self._hop_index = 0
+        self._hops_seen = 0
+        self._acc_energy = 0.0 # partial hop carried over between chunks
+        self._acc_peak = 0.0
+        self._acc_n = 0
+
+    def process(self, samples):
+        """
+        Feed a chunk of int16 samples.
+
+        Returns:
+            Dict of arrays with one entry per hop completed in this chunk:
+            'end' (offset in the chunk where the hop ended), 'peak', 'rms', 'leq' in dBFS
+        """
+        n = len(samples)
+        if n == 0:
+            return {key: np.zeros(0) for key in ('end', 'peak', 'rms', 'leq')}
+        x = samples.astype(np.float64)
+        ends = np.arange(self.hop - self._acc_n, n + 1, self.hop)
+        bounds = np.concatenate(([0], ends, [n] if len(ends) == 0 or ends[-1] < n else []))
+        starts = bounds[:-1].astype(np.intp)
+        energies = np.add.reduceat(x * x, starts)
+        peaks = np.maximum.reduceat(np.abs(x), starts)
+
+        hop_energy = np.empty(len(ends))
+        hop_peak = np.empty(len(ends))
+        window_energy = np.empty(len(ends))
+        window_len = np.empty(len(ends))
+        for i in range(len(ends)):
+            energy = energies[i] + (self._acc_energy if i == 0 else 0.0)
+            peak = max(peaks[i], self._acc_peak) if i == 0 else peaks[i]
+            self._hop_energy[self._hop_index] = energy
+            self._hop_index = (self._hop_index + 1) % self.hops_per_window
+            self._hops_seen += 1
+            hop_energy[i] = energy
+            hop_peak[i] = peak
+            window_energy[i] = self._hop_energy.sum()
+            window_len[i] = min(self._hops_seen, self.hops_per_window) * self.hop
+        if len(ends):
+            self._acc_energy, self._acc_peak, self._acc_n = 0.0, 0.0, 0
+        if len(starts) > len(ends): # trailing partial hop
+            self._acc_energy += energies[-1]
+            self._acc_peak = max(self._acc_peak, peaks[-1])
+            self._acc_n += n - int(starts[-1])
+        return {
+            'end': ends,
+            'peak': level_db(hop_peak**2),
+            'rms': level_db(window_energy / np.maximum(window_len, 1)),
+            'leq': level_db(hop_energy / self.hop)
+        }
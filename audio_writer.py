@@ -0,0 +1,144 @@
+import os
+import queue
+import threading
+import wave
+from datetime import datetime
+from div import log
+
+WAV_QUEUE_SIZE = 512 # chunks waiting for the writer before new ones are dropped
+
+class WavWriter:
+    """
+    Streams audio to WAV files from a background thread.
+
+    The receive path only calls submit(), which never blocks: chunks go on a
+    bounded queue and are dropped (and counted) when the disk can't keep up.
+    The writer keeps one file open and rolls over to a new one after
+    max_seconds of audio or max_bytes of sample data, whichever comes first.
+
+    With an audio.AudioRing the queue only holds sample ranges, and the
+    writer reads them straight out of the ring; samples the ring overwrote
+    before the writer got to them are counted in overwritten_frames.
+    """
+    def __init__(self, directory="audio_files", base_filename="audio_recording",
+                 sample_rate=32018, max_seconds=10, max_bytes=None, queue_size=WAV_QUEUE_SIZE, ring=None):
+        self.directory = directory
+        self.ring = ring
+        self.base_filename = base_filename
+        self.sample_rate = sample_rate
+        self.max_frames = int(sample_rate * max_seconds)
+        if max_bytes:
+            self.max_frames = min(self.max_frames, max_bytes // 2)
+        self.submitted = 0
+        self.dropped = 0
+        self.written_frames = 0
+        self.overwritten_frames = 0
+        self.files = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._stopped = False # set by stop(), later chunks are dropped until start()
+        self._wav = None
+        self._frames_in_file = 0
+
+    def start(self):
+        self._stopped = False
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="wav-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, samples):
+        """Queue an int16 array the caller won't modify again, returns False if it was dropped"""
+        return self._put(samples)
+
+    def submit_range(self, start, end):
+        """Queue the ring's samples [start, end) (absolute positions), returns False if they were dropped"""
+        return self._put((start, end))
+
+    def _put(self, item):
+        if self._stopped: # a thread still holding a retired device must not open a new file
+            self.dropped += 1
+            return False
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def stop(self):
+        """Write out what is queued, close the current file and stop the thread"""
+        self._stopped = True
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                if isinstance(item, tuple):
+                    self._write_range(*item)
+                else:
+                    self._write(item)
+            except Exception as e:
+                self.errors += 1
+                log(f"Error writing audio file: {str(e)}")
+                self._close_file()
+        self._close_file()
+
+    def _write_range(self, start, end):
+        for samples in self.ring.segments(start, end):
+            self._write(samples)
+        # the receive thread may have wrapped over the range while it was being written
+        self.overwritten_frames += max(0, min(end, self.ring.oldest()) - start)
+
+    def _write(self, samples):
+        while len(samples) > 0:
+            if self._wav is None:
+                self._open_file()
+            take = min(len(samples), self.max_frames - self._frames_in_file)
+            self._wav.writeframesraw(samples[:take])
+            self._frames_in_file += take
+            self.written_frames += take
+            samples = samples[take:]
+            if self._frames_in_file >= self.max_frames:
+                self._close_file()
+
+    def _open_file(self):
+        os.makedirs(self.directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = os.path.join(self.directory, f"{self.base_filename}_{timestamp}_{self.files}.wav")
+        log(f"saving audio data to {filename}")
+        self._wav = wave.open(filename, "wb")
+        self._wav.setnchannels(1)  # Mono
+        self._wav.setsampwidth(2)  # 16 bits
+        self._wav.setframerate(self.sample_rate)
+        self._frames_in_file = 0
+        self.files += 1
+
+    def _close_file(self):
+        if self._wav is not None:
+            try:
+                self._wav.close() # patches the header with the final length
+            finally:
+                self._wav = None
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+            "written_seconds": round(self.written_frames / self.sample_rate, 1),
+            "overwritten_seconds": round(self.overwritten_frames / self.sample_rate, 1),
+            "files": self.files,
+            "errors": self.errors
+        }
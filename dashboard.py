@@ -1,5 +1,5 @@
 import dash
-from dash import html, dcc, callback, Input, Output
+from dash import html, dcc, callback, Input, Output, State, no_update
 import pandas as pd
 import asyncio
 import plotly.express as px
@@ -7,10 +7,27 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import dash_bootstrap_components as dbc
 from datetime import datetime
-from database import recent_data
+import time
+from database import snapshot, devices, BUCKET_RESOLUTION, SNAPSHOT_MAX_AGE
+from downsample import downsample
+import data_process
+from spectrogram import BAND_LABELS
 from div import log_setup, log
 log_setup()
 
+WINDOW_MINUTES = 5 # time span shown in the graphs
+REDRAW_SECONDS = 60 # full redraw interval, re-decimates what extendData has appended
+# point budget per trace and decimation method for each graph,
+# min/max keeps every peak where spikes matter, LTTB keeps the shape elsewhere
+GRAPH_POINTS = {
+    "temperature_graph": (200, "lttb"),
+    "humidity_graph": (200, "lttb"),
+    "vibration_graph": (200, "minmax"),
+    "audio_graph": (200, "minmax")
+}
+SPECTROGRAM_COLUMNS = 300 # time columns in the heatmap, frames are averaged down to this
+SPECTROGRAM_RANGE = (-90, 0) # colour scale in dB
+
 app = dash.Dash(__name__,
     external_stylesheets=[dbc.themes.BOOTSTRAP, 'https://use.fontawesome.com/releases/v5.8.1/css/all.css'],
     requests_pathname_prefix="/dashboard/",
@@ -40,6 +57,9 @@ def rowwrap(*input):
           return dbc.Row([
                      *input
                 ])
+def create_graph_state(graph_id):
+    # last timestamp this browser has for the graph, drives extendData updates
+    return dcc.Store(id=f"{graph_id}_state")
 def create_header():
     return html.Div([
         html.H1("ECHO Monitor Dashboard")
@@ -48,23 +68,22 @@ def create_device_selector():
      return wrap(html.Div([
                 dcc.Dropdown(
                id="device_dropdown",
-                options=[
-                {'label': 'Device 001', 'value': 'dev001'},
-                {'label': 'Device 002', 'value': 'dev002'},
-                {'label': 'Device 003', 'value': 'dev003'}
-            ],
-            value='dev001'
+                options=[], # filled with the devices that have sent data
+                placeholder="Waiting for devices...",
+                clearable=False
                )
      ]))
 def create_temp():
     return wrap(html.Div([
         html.H3("Temperature"),
-        dcc.Graph(id="temperature_graph",className="mt-4")
+        dcc.Graph(id="temperature_graph",className="mt-4"),
+        create_graph_state("temperature_graph")
     ]))
 def create_humid():
     return  wrap(html.Div([
                 html.H3("Humidity",className="mt-4"),
-                dcc.Graph(id="humidity_graph")
+                dcc.Graph(id="humidity_graph"),
+                create_graph_state("humidity_graph")
     ]) 
     )
 def create_acoustics():
@@ -72,17 +91,26 @@ def create_acoustics():
              dbc.Card([
                 dbc.CardBody([
                 html.H4("Acoustics",className="card-title"),
-                html.P("info",className="card-text",),
-                dbc.Button("Play", color="primary", className="me-2"),
-                dbc.Button("Pause", color="primary", className="me-2"),
-                dbc.Button("Stop", color="primary", className="me-2")
+                html.P("Live audio stopped",id="audio_player_status",className="card-text",),
+                html.Span(id="audio_player_device", hidden=True), # read by audio_player.js
+                # wired up in assets/audio_player.js, streams from /ws/audio
+                dbc.Button("Play", id="audio_play", color="primary", className="me-2"),
+                dbc.Button("Pause", id="audio_pause", color="primary", className="me-2"),
+                dbc.Button("Stop", id="audio_stop", color="primary", className="me-2")
             ])
         ])
     ]))
+def create_spectrogram():
+    return wrap(html.Div([
+        html.H3("Spectrogram"),
+        dcc.Graph(id="spectrogram_graph"),
+        create_graph_state("spectrogram_graph")
+    ]))
 def create_vib():
     return wrap(html.Div([
         html.H3("Vibration"),
-        dcc.Graph(id="vibration_graph")
+        dcc.Graph(id="vibration_graph"),
+        create_graph_state("vibration_graph")
     ]))
 def create_tof():
     return wrap(html.Div([
@@ -97,7 +125,8 @@ def create_tof():
 def create_audio():
         return wrap(html.Div([
         html.H3("Audio"),
-        dcc.Graph(id="audio_graph",className="mt-4")
+        dcc.Graph(id="audio_graph",className="mt-4"),
+        create_graph_state("audio_graph")
     ]))
 ### common graph layout
 def graph_layout():
@@ -130,8 +159,9 @@ def create_dummy_graph(y_reading):
         **graph_layout()
     )
     return fig
-def create_sensor_graph(y_reading,y_reading_secondary = None):
-    data = recent_data()
+def create_sensor_graph(y_reading,y_reading_secondary = None, data = None, max_points = None, method = "lttb"):
+    if data is None:
+        data = snapshot() # shared by all graphs and clients for this tick
     #log(data)
     if data.empty:
         return create_dummy_graph(y_reading)
@@ -142,24 +172,18 @@ def create_sensor_graph(y_reading,y_reading_secondary = None):
         log(f"Missing required column: {y_reading} or timestamp")
         return create_dummy_graph(y_reading)   
     if y_reading_secondary is not None:
-        fig = create_multi_plot_graph(y_reading,y_reading_secondary, data)
+        fig = create_multi_plot_graph(y_reading,y_reading_secondary, data, max_points, method)
     else:
-        fig = create_single_plot_graph(y_reading, data)
+        fig = create_single_plot_graph(y_reading, data, max_points, method)
     return fig            
-def create_multi_plot_graph(y_reading,y_reading_secondary,data):
+def create_multi_plot_graph(y_reading,y_reading_secondary,data,max_points=None,method="lttb"):
     fig = make_subplots(specs=[[{"secondary_y": True}]])
-
-    y1_min, y1_max = min(data[y_reading]), max(data[y_reading])
-    y2_min, y2_max = min(data[y_reading_secondary]), max(data[y_reading_secondary])
-    y_min = min(y1_min, y2_min)
-    y_max = max(y1_max, y2_max)
-    y_range = [y_min - 0.1 * (y_max - y_min), y_max + 0.1 * (y_max - y_min)]
-
-    
+    x, y = downsample(data["timestamp"], data[y_reading], max_points, method)
+    x2, y2 = downsample(data["timestamp"], data[y_reading_secondary], max_points, method)
     fig.add_trace(
         go.Scatter(
-            x=data["timestamp"], 
-            y=data[y_reading], 
+            x=x, 
+            y=y, 
             mode='lines+markers',
             name=y_reading,
             connectgaps=True
@@ -167,22 +191,24 @@ def create_multi_plot_graph(y_reading,y_reading_secondary,data):
         secondary_y=False
     )
     fig.add_trace(go.Scatter(
-        x=data["timestamp"], 
-        y=data[y_reading_secondary], 
+        x=x2, 
+        y=y2, 
         mode='lines+markers',
         name=y_reading_secondary,
         connectgaps=True
         ),secondary_y=True
     )
     fig.update_layout(**graph_layout())
-    fig.update_yaxes(title_text=y_reading,range=y_range, secondary_y=False)
-    fig.update_yaxes(title_text=y_reading_secondary,range=y_range, secondary_y=True)
+    # same scale on both axes, autoranged so points added with extendData stay visible
+    fig.update_yaxes(title_text=y_reading, secondary_y=False)
+    fig.update_yaxes(title_text=y_reading_secondary, matches="y", secondary_y=True)
     return fig   
-def create_single_plot_graph(y_reading,data):
+def create_single_plot_graph(y_reading,data,max_points=None,method="lttb"):
     fig = go.Figure()
+    x, y = downsample(data["timestamp"], data[y_reading], max_points, method)
     fig.add_trace(go.Scatter(
-            x=data["timestamp"], 
-            y=data[y_reading], 
+            x=x, 
+            y=y, 
             mode='lines+markers',
             name=y_reading,
             connectgaps=True
@@ -190,31 +216,146 @@ def create_single_plot_graph(y_reading,data):
     fig.update_layout(**graph_layout())
     return fig
 
+_spectrogram_figures = {} # device -> (version, time, figure), shared by every viewer
+def spectrogram_figure(device, spectrogram):
+    """Heatmap of the device's recent 1/3-octave levels, rebuilt like snapshot() at most every SNAPSHOT_MAX_AGE"""
+    cached = _spectrogram_figures.get(device)
+    now = time.monotonic()
+    if cached is not None and (cached[0] == spectrogram.version or now - cached[1] < SNAPSHOT_MAX_AGE):
+        return cached[2]
+    version = spectrogram.version
+    times, levels = spectrogram.recent(WINDOW_MINUTES * 60, SPECTROGRAM_COLUMNS)
+    unit = "dBA" if spectrogram.a_weighting else "dBFS"
+    fig = go.Figure(go.Heatmap(
+        x=times,
+        y=BAND_LABELS,
+        z=levels.T,
+        zmin=SPECTROGRAM_RANGE[0],
+        zmax=SPECTROGRAM_RANGE[1],
+        colorscale="Viridis",
+        colorbar={"title": unit}
+    ))
+    fig.update_layout(**graph_layout())
+    fig.update_yaxes(title_text="Hz", type="category")
+    _spectrogram_figures[device] = (version, now, fig)
+    return fig
+
+### incremental updates
+def json_values(series):
+    # NaN is not valid JSON, plotly wants null for gaps
+    return series.astype(object).where(series.notna(), None).tolist()
+def update_sensor_graph(state, graph_id, device, y_reading, y_reading_secondary = None):
+    """
+    Full figure on first load, after a gap, on a device change and every
+    REDRAW_SECONDS, otherwise only the points the browser hasn't seen.
+
+    Returns:
+        Tuple of (figure, extendData, state) for the graph's callback outputs
+    """
+    data = snapshot(WINDOW_MINUTES, device=device)
+    if state and state.get("device") != device:
+        state = None # different device, start over
+    if not data.empty: # the newest bucket is still filling up, send it once it's complete
+        data = data[data["timestamp"] < pd.Timestamp.now().floor(BUCKET_RESOLUTION)]
+    last_seen = pd.Timestamp(state["last"]) if state and state.get("last") else None
+    if data.empty:
+        if state is None:
+            return create_dummy_graph(y_reading), no_update, {"last": None, "device": device}
+        return no_update, no_update, no_update
+    newest = data["timestamp"].iloc[-1]
+    max_points, method = GRAPH_POINTS[graph_id]
+    if (last_seen is None or last_seen < data["timestamp"].iloc[0]
+            or time.time() - state.get("drawn", 0) >= REDRAW_SECONDS):
+        fig = create_sensor_graph(y_reading, y_reading_secondary, data, max_points, method)
+        return fig, no_update, {"last": newest.isoformat(), "drawn": time.time(), "device": device}
+    new = data[data["timestamp"] > last_seen]
+    if new.empty:
+        return no_update, no_update, no_update
+    readings = [y_reading] if y_reading_secondary is None else [y_reading, y_reading_secondary]
+    x = new["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S").tolist()
+    extend = (
+        {"x": [x] * len(readings), "y": [json_values(new[reading]) for reading in readings]},
+        list(range(len(readings))),
+        max_points
+    )
+    return no_update, extend, {**state, "last": newest.isoformat()}
+
 ### callback functions
+@callback(
+    Output('device_dropdown', 'options'),
+    Output('device_dropdown', 'value'),
+    Output('audio_player_device', 'children'),
+    Input('interval-component', 'n_intervals'),
+    Input('device_dropdown', 'value'),
+    State('device_dropdown', 'options')
+)
+def update_device_dropdown(n_intervals, device, options):
+    known = devices()
+    new_options = [{'label': device_id, 'value': device_id} for device_id in known]
+    new_options = no_update if new_options == options else new_options
+    if device is None and known: # pick the first device once one has sent data
+        return new_options, known[0], known[0]
+    return new_options, no_update, device
 @callback(
     Output('temperature_graph', 'figure'),
-    Input('interval-component', 'n_intervals')
+    Output('temperature_graph', 'extendData'),
+    Output('temperature_graph_state', 'data'),
+    Input('interval-component', 'n_intervals'),
+    Input('device_dropdown', 'value'),
+    State('temperature_graph_state', 'data')
 )
-def update_temperature_graph(n_intervals):
-    return create_sensor_graph("Inside_temperature","Outside_temperature")
+def update_temperature_graph(n_intervals, device, state):
+    return update_sensor_graph(state, "temperature_graph", device, "Inside_temperature","Outside_temperature")
 @callback(
     Output('humidity_graph', 'figure'),
-    Input('interval-component', 'n_intervals')
+    Output('humidity_graph', 'extendData'),
+    Output('humidity_graph_state', 'data'),
+    Input('interval-component', 'n_intervals'),
+    Input('device_dropdown', 'value'),
+    State('humidity_graph_state', 'data')
 )
-def update_humidity_graph(n_intervals):
-    return create_sensor_graph("Inside_humidity","Outside_humidity")
+def update_humidity_graph(n_intervals, device, state):
+    return update_sensor_graph(state, "humidity_graph", device, "Inside_humidity","Outside_humidity")
 @callback(
     Output('vibration_graph', 'figure'),
-    Input('interval-component', 'n_intervals')
+    Output('vibration_graph', 'extendData'),
+    Output('vibration_graph_state', 'data'),
+    Input('interval-component', 'n_intervals'),
+    Input('device_dropdown', 'value'),
+    State('vibration_graph_state', 'data')
 )
-def update_vibration_graph(n_intervals):
-    return create_sensor_graph("Vibration")
+def update_vibration_graph(n_intervals, device, state):
+    return update_sensor_graph(state, "vibration_graph", device, "Vib_rms", "Vib_peak")
 @callback(
     Output('audio_graph', 'figure'),
-    Input('interval-component', 'n_intervals')
+    Output('audio_graph', 'extendData'),
+    Output('audio_graph_state', 'data'),
+    Input('interval-component', 'n_intervals'),
+    Input('device_dropdown', 'value'),
+    State('audio_graph_state', 'data')
+)
+def update_audio_graph(n_intervals, device, state):
+    return update_sensor_graph(state, "audio_graph", device, "DB")
+
+@callback(
+    Output('spectrogram_graph', 'figure'),
+    Output('spectrogram_graph_state', 'data'),
+    Input('interval-component', 'n_intervals'),
+    Input('device_dropdown', 'value'),
+    State('spectrogram_graph_state', 'data')
 )
-def update_audio_graph(n_intervals):
-    return create_sensor_graph("DB")
+def update_spectrogram_graph(n_intervals, device, state):
+    # computed at ingest, so only available when ingestion runs in this process
+    ingest = data_process.devices.get(device)
+    if ingest is None or ingest.spectrogram.version == 0:
+        if state is None or state.get("device") != device:
+            return create_dummy_graph("Spectrogram"), {"device": device, "version": 0}
+        return no_update, no_update
+    spectrogram = ingest.spectrogram
+    if state and state.get("device") == device and state.get("version") == spectrogram.version:
+        return no_update, no_update
+    fig = spectrogram_figure(device, spectrogram)
+    return fig, {"device": device, "version": _spectrogram_figures[device][0]} # version drawn, may be a cached one
 
 ### layout 
 app.layout = dbc.Container([
@@ -225,6 +366,7 @@ app.layout = dbc.Container([
     create_vib(),
     create_tof(),
     create_audio(),
+    create_spectrogram(),
     create_acoustics(),
     create_interval()
 ], fluid=True)
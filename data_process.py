@@ -1,12 +1,17 @@
 
 from datetime import datetime, timedelta
 import json
+import threading
 from div import log
-from database import add_data
+from database import add_batch, add_audio_metrics, add_vibration_features, rename_device, forget_device, DEFAULT_DEVICE
 import numpy as np
-import wave
-import os
-import math
+from audio import AudioRing, AudioReorderBuffer, LoudnessMeter
+from audio_writer import WavWriter
+from live import AudioStreamer
+from device_clock import DeviceClock
+from vibration import VibrationAnalyzer
+from spectrogram import Spectrogram
+from packets import is_binary_packet, decode_binary_packet, checked_clock, MISSING_VALUE, is_audio_packet, decode_audio_packet
 
 
 KEYS_LIST= ["Vibration",
@@ -14,152 +19,457 @@ KEYS_LIST= ["Vibration",
 "Outside_temperature",
 "Inside_humidity",
 "Outside_humidity",
-"Time_of_flight",
-"DB"]
+"Time_of_flight"]
+DEVICE_KEYS = ["device", "device_id"] # JSON fields naming the sending board
+DEVICE_TIME_KEY = "t0" # optional JSON field, device time of the first reading in ms
+DEVICE_RATE_KEY = "rate" # optional JSON field, readings per second
+PACKET_SECONDS = 1.0 # assumed span of a packet without device time until the interval is measured
+PACKET_GAP_FACTOR = 5 # a gap longer than this many packet intervals is a silence, not one packet's span
+PACKET_INTERVAL_SMOOTHING = 0.25 # weight of the newest gap in the measured packet interval
+SEQUENCE_REORDER_WINDOW = 64 # a sequence number further behind than this means the board restarted
+SEQUENCE_RESYNC_GAP = 10000 # as does one further ahead than this
 
-prev_time = None
+
+SCALE_DIVISORS = {# all values are sent from microcontroller as 16bit int
+    "Time_of_flight": 10,
+    "Inside_temperature": 100,
+    "Outside_temperature": 100,
+    "Inside_humidity": 100,
+    "Outside_humidity": 100,
+}
 
 
 def handle_json_data(data, address):
-    """Process incoming JSON sensor data and add to database"""
+    """Process an incoming sensor packet (JSON or binary) and add to database"""
     try:
-        json_data = json.loads(data.decode("utf-8"))# parse JSON data
         current_time = datetime.now()
-        max_length, timestamps = calculate_timestamps(json_data, current_time) 
-        if max_length == 0:
-            return True  # No data to process
-        # Process each reading
-        for i in range(max_length):
-            # Create reading object with timestamp
-            reading = {'timestamp': timestamps[i].isoformat()}
-            for key in KEYS_LIST: # Extract values for each sensor key and add to timestamp
-                reading[key] = validate_and_extract(json_data, key, i)
-            add_data(reading)   
-        return True   
+        device_id, columns, seq, clock = parse_sensor_packet(data)
+        return add_sensor_packet(device_id, columns, address, current_time, seq, clock)
     except Exception as e:
-        log(f"Error processing JSON data: {str(e)}")
+        log(f"Error processing sensor data: {str(e)}")
         return False
+
+def parse_sensor_packet(data):
+    """
+    Decode a sensor packet in either format, detected per packet (see packets.py).
+
+    Returns:
+        Tuple of (device id or None, dict of KEYS_LIST column -> float array,
+        sequence number or None for JSON, (device time ms, rate) or None)
+    """
+    if is_binary_packet(data):
+        device_id, seq, samples, clock = decode_binary_packet(data)
+        length = len(next(iter(samples.values()))) if samples else 0
+        columns = {key: scale_column(samples.get(key), key, length) for key in KEYS_LIST}
+        return device_id, columns, seq, clock
+    device_id, columns, clock = parse_json_packet(data)
+    return device_id, columns, None, clock
+
+def scale_column(samples, key, length):
+    """Scaled float array from raw int16 samples, MISSING_VALUE and absent keys become NaN"""
+    if samples is None:
+        return np.full(length, np.nan)
+    column = samples.astype(np.float64) / SCALE_DIVISORS.get(key, 1)
+    column[samples == MISSING_VALUE] = np.nan
+    return column
+
+def parse_json_packet(data):
+    """
+    Decode a JSON packet into scaled columns. Uses no ingestion state, so it can run in a worker process.
+
+    Returns:
+        Tuple of (device id or None, dict of KEYS_LIST column -> float array,
+        (device time ms, rate) or None). Vibration keeps its own length, the
+        slow columns share the length of the longest of them; the arrays are
+        empty if the packet holds no readings
+    """
+    json_data = json.loads(data.decode("utf-8"))# parse JSON data
+    slow_length = 0
+    for key in KEYS_LIST[1:]:
+        if key in json_data and isinstance(json_data[key], list):
+            slow_length = max(slow_length, len(json_data[key]))
+    vibration = json_data.get("Vibration")
+    columns = {key: extract_column(json_data, key, slow_length) for key in KEYS_LIST[1:]}
+    columns["Vibration"] = extract_column(json_data, "Vibration", len(vibration) if isinstance(vibration, list) else 0)
+    return json_device_id(json_data), columns, json_clock(json_data)
+
+def json_clock(json_data):
+    """(device time ms, rate) of a JSON packet, None unless it has both and they are usable"""
+    return checked_clock(json_data.get(DEVICE_TIME_KEY), json_data.get(DEVICE_RATE_KEY))
+
+def add_sensor_packet(device_id, columns, address, current_time, seq=None, clock=None):
+    """Timestamp a parsed packet with its device's state and store it"""
+    device = device_for(address, device_id)
+    if device is None:
+        return False
+    device.sensor_sequence(seq)
+    slow, features = sensor_rows(columns, current_time, device, clock)
+    store_sensor_rows(device.device_id, slow, features)
+    return True
+
+def sensor_rows(columns, current_time, device, clock=None):
+    """
+    Timestamped rows of one parsed packet, using only the timing and vibration state of device.
+
+    The packet is timestamped at the length of its longest column. A shorter
+    column (e.g. two temperatures next to 300 vibration samples) is spread
+    over the same span, and only slow rows with at least one reading are kept.
+
+    Returns:
+        Tuple of ((timestamps, slow columns) or None, vibration feature
+        dict as returned by VibrationAnalyzer.process or None)
+    """
+    vibration = columns["Vibration"]
+    slow = {key: values for key, values in columns.items() if key != "Vibration"}
+    slow_length = len(next(iter(slow.values())))
+    length = max(len(vibration), slow_length)
+    if length == 0:
+        return None, None  # No data to process
+    timestamps = calculate_timestamps(length, current_time, device, clock)
+    features = None
+    if len(vibration):
+        features = vibration_features(spread_timestamps(timestamps, len(vibration)), vibration, device) # full rate, not per second means
+    keep = np.zeros(slow_length, dtype=bool)
+    for values in slow.values():
+        keep |= ~np.isnan(values)
+    if not keep.any(): # vibration-only packets add no empty rows
+        return None, features
+    rows = {key: values[keep] for key, values in slow.items()}
+    return (spread_timestamps(timestamps, slow_length)[keep], rows), features
+
+def store_sensor_rows(device_id, slow, features):
+    """Store the rows made by sensor_rows, each channel in one write"""
+    if features is not None and len(features['timestamp']):
+        features = dict(features)
+        add_vibration_features(features.pop('timestamp'), features, device_id)
+    if slow is not None:
+        add_batch(slow[0], slow[1], device_id) # whole packet in one store write
+
+def spread_timestamps(timestamps, n):
+    """n of a packet's timestamps, evenly spaced and ending with the last one"""
+    length = len(timestamps)
+    if n == length:
+        return timestamps
+    return timestamps[np.arange(1, n + 1) * length // n - 1]
     
-def calculate_timestamps(json_data, current_time):
+def calculate_timestamps(length, current_time, device, clock=None):
     """
-    Calculate timestamps for sensor readings based on array lengths.
+    Calculate timestamps for the readings of one packet.
+
+    Packets with a device time go through the device's clock model. Others
+    are spread over the time since the previous packet arrived. After a
+    silence, and for the first packet, they are spread over the device's
+    measured packet interval instead.
     
     Args:
-        json_data: Dictionary of sensor readings
-        current_time: Current time
+        length: Number of readings per column in the packet
+        current_time: Arrival time of the packet
+        device: DeviceState of the sender, holds the previous packet's time
+        clock: (device time ms of the first reading, readings per second) or None
         
     Returns:
-        Tuple of (max_length, list_of_timestamps)
+        datetime64 array of timestamps
     """
-    global prev_time
-    max_length = 0
-    for key in KEYS_LIST:
-        if key in json_data and isinstance(json_data[key], list):
-            max_length = max(max_length, len(json_data[key]))
-    if max_length == 0:
-        return 0, []  # No data to process
-    if prev_time is None:# initialize prev_time if first data
-        prev_time = current_time - timedelta(seconds=max_length)
-    time_interval = (current_time - prev_time) / max_length
-
-    timestamps = [prev_time + time_interval * (i + 1) for i in range(max_length)]
-    prev_time = current_time #update previtme for next data
-    return max_length, timestamps
+    if clock is not None:
+        device.prev_time = current_time
+        return device.clock.timestamps(clock[0], clock[1], length, current_time)
+    prev_time = device.prev_time
+    interval = device.packet_interval or PACKET_SECONDS
+    gap = None if prev_time is None else (current_time - prev_time).total_seconds()
+    if gap is None or gap <= 0 or gap > PACKET_GAP_FACTOR * interval:
+        prev_time = current_time - timedelta(seconds=interval) # first packet, or after a silence
+    if gap is not None and gap > 0:
+        # a silence only stretches the interval a bounded step, so a slow sender is learned in a few packets
+        gap = min(gap, PACKET_GAP_FACTOR * interval)
+        device.packet_interval = gap if device.packet_interval is None else \
+            interval + PACKET_INTERVAL_SMOOTHING * (gap - interval)
+    start = np.datetime64(prev_time, 'ns')
+    span = (np.datetime64(current_time, 'ns') - start).astype(np.int64)
+    # spread samples evenly over (prev_time, current_time]
+    offsets = np.linspace(0, span, length + 1)[1:].astype(np.int64)
+    timestamps = start + offsets.astype('timedelta64[ns]')
+    device.prev_time = current_time #update previtme for next data
+    return timestamps
     
-def validate_and_extract(data, key, index):
-    if (key in data and 
-        isinstance(data[key], list) and
-                    data[key] and                   
-                    index < len(data[key])):
-        value = data[key][index]
-        scaled_value = scale_if_needed(key, value)
-        return scaled_value ##scaled_value
-    else:
-        return np.nan
+def extract_column(data, key, length):
+    """Scaled float array of length `length` for key, padded with NaN"""
+    column = np.full(length, np.nan)
+    values = data.get(key)
+    if isinstance(values, list) and values:
+        values = np.asarray(values[:length], dtype=np.float64) # None -> NaN
+        column[:len(values)] = values / SCALE_DIVISORS.get(key, 1)
+    return column
     
-def scale_if_needed(key, value):
-    """Scale sensor values as all values are sent from microcontroller as 16bit int"""
-    # Check for None or np.nan first
-    if value is None or (isinstance(value, float) and np.isnan(value)):
-        return np.nan
-        
-    # Now we know value is a number and not None
-    if key == "Time_of_flight":
-        return value/10
-    elif key in ["Inside_temperature", "Outside_temperature"]:
-        return value/100 
-    elif key in ["Inside_humidity", "Outside_humidity"]:
-        return value/100
-    else:
-        return value   
 def handle_audio_data(data,adress):
-    add_audio_chunk(data)
+    device = device_for(adress)
+    if device is None:
+        return
+    for chunk in audio_chunks(data, device):
+        add_audio_chunk(chunk, device)
     return
 
-def process_vibration_data(data):
-    return
+def audio_chunks(data, device):
+    """The int16 chunks an audio datagram adds to the stream, in order, after the device's reorder buffer"""
+    if not is_audio_packet(data): # bare samples from boards without the sequence header
+        return [data]
+    seq, samples = decode_audio_packet(data)
+    return device.audio_reorder.push(seq, samples)
+
+def vibration_features(timestamps, values, device):
+    """Run a block of vibration samples through the device's analyzer, a feature row per completed window"""
+    try:
+        return device.vibration.process(timestamps, values)
+    except Exception as e:
+        log(f"Error processing vibration data: {str(e)}")
+        return None
 
 
 
-audio_buffer = bytearray()
-file_counter = 0
-base_filename = "audio_recording"
-max_buffer_size = 32018 * 2 * 10
-buffer_counter = 0
-def add_audio_chunk(chunk):
-    global audio_buffer, buffer_counter
-    audio_buffer.extend(chunk)
-    buffer_counter += 1
-    if buffer_counter >= 10:
-        buffer_counter = 0
-        calculate_db()
-    if len(audio_buffer) >= max_buffer_size:
-        log("saving audio data")
-        save_buffer()
-def save_buffer():
-    global audio_buffer, file_counter
-    if len(audio_buffer)<= 0:
-        return "no audio to save"
-    os.makedirs("audio_files", exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = os.path.join("audio_files",f"{base_filename}_{timestamp}_{file_counter}.wav")
-
-    audio_array = np.frombuffer(audio_buffer,dtype=np.int16)
-    with  wave.open(filename, "wb") as wav_file:
-        wav_file.setnchannels(1)  # Mono
-        wav_file.setsampwidth(2)  # 16 bits
-        wav_file.setframerate(32018)  # sample rate
-        wav_file.writeframes(audio_array.tobytes())
-    file_counter += 1
-    audio_buffer = bytearray()
-def calculate_db():
-    global audio_buffer
+AUDIO_SAMPLE_RATE = 32018
+AUDIO_RING_SECONDS = 30 # audio kept in memory per device, the WAV writer and streamer read from it
+DB_WINDOW_SECONDS = 1.0 # RMS window of the DB reading
+DB_HOP_SECONDS = 0.25 # one DB reading per hop
+AUDIO_REORDER_PACKETS = 4 # sequenced audio packets held back to put reordered ones in place
+AUDIO_CONCEALMENT = "interpolate" # or "silence", fill for lost audio packets
+
+class DeviceState:
+    """Everything ingestion keeps per sending board: timestamp interpolation, audio buffers and meters"""
+    def __init__(self, device_id, address=None, named=True):
+        self.device_id = device_id
+        self.address = address
+        self.named = named # False while the device is only known by its IP
+        self.prev_time = None # arrival of the previous sensor packet
+        self.packet_interval = None # smoothed seconds between sensor packets
+        self.clock = DeviceClock() # device time -> server time, for packets that carry device time
+        self.packets = 0
+        self.sensor_seq = None # newest binary packet sequence number
+        self.lost_packets = 0
+        self.reordered_packets = 0
+        self.last_seen = None
+        self.audio_ring = AudioRing(AUDIO_SAMPLE_RATE * AUDIO_RING_SECONDS) # the one copy of every chunk
+        self.wav_writer = WavWriter(base_filename=f"audio_recording_{device_id}", sample_rate=AUDIO_SAMPLE_RATE,
+                                    max_seconds=10, ring=self.audio_ring) # rolls over every 10 s
+        self.audio_streamer = AudioStreamer(AUDIO_SAMPLE_RATE) # live audio to browsers
+        self.loudness_meter = LoudnessMeter(AUDIO_SAMPLE_RATE, DB_WINDOW_SECONDS, DB_HOP_SECONDS)
+        self.audio_reorder = AudioReorderBuffer(AUDIO_REORDER_PACKETS, AUDIO_CONCEALMENT)
+        self.vibration = VibrationAnalyzer() # features and a bounded raw waveform
+        self.spectrogram = Spectrogram(AUDIO_SAMPLE_RATE) # 1/3-octave bands for the dashboard heatmap
+
+    def sensor_sequence(self, seq):
+        """
+        Count lost and out of order binary sensor packets from their sequence numbers.
+
+        A sequence number far from the newest one means the board restarted,
+        so the count and the clock model start over.
+        """
+        if seq is None:
+            return
+        if self.sensor_seq is not None:
+            gap = (seq - self.sensor_seq - 1) & 0xffffffff # wraps at 2**32
+            if gap >= 2**31 and 2**32 - gap <= SEQUENCE_REORDER_WINDOW + 1: # a little older than the newest one
+                self.reordered_packets += 1
+                return
+            if gap >= 2**31 or gap > SEQUENCE_RESYNC_GAP:
+                self.clock.reset()
+                self.prev_time = None
+            else:
+                self.lost_packets += gap
+        self.sensor_seq = seq
+
+    def start(self, loop):
+        self.wav_writer.start()
+        self.audio_streamer.start(loop)
+
+    def stop(self):
+        self.wav_writer.stop()
+        self.audio_streamer.stop()
+
+    def stats(self):
+        return {
+            "address": None if self.address is None else f"{self.address[0]}:{self.address[1]}",
+            "packets": self.packets,
+            "lost_packets": self.lost_packets,
+            "reordered_packets": self.reordered_packets,
+            "last_seen": None if self.last_seen is None else self.last_seen.isoformat(),
+            "clock": self.clock.stats(),
+            "vibration": self.vibration.stats(),
+            "spectrogram": self.spectrogram.stats(),
+            "audio_sequence": self.audio_reorder.stats(),
+            "wav_writer": self.wav_writer.stats(),
+            "streamer": self.audio_streamer.stats()
+        }
+
+MAX_DEVICES = 64 # devices kept in memory, packets from further senders are ignored
+DEVICE_EXPIRY_SECONDS = 600 # idle provisional devices make room for new ones after this
+
+devices = {} # device id -> DeviceState
+rejected_packets = 0 # packets ignored because MAX_DEVICES were known
+_address_devices = {} # source IP -> device id, so audio from a board lands with its JSON data
+_devices_lock = threading.Lock()
+_loop = None # event loop for the audio streamers, set by start_devices()
+
+def json_device_id(json_data):
+    """Device id a JSON packet names, None if it doesn't"""
+    for key in DEVICE_KEYS:
+        if json_data.get(key) is not None:
+            return str(json_data[key])
+    return None
+
+def device_for(address, device_id=None):
+    """
+    DeviceState for a packet, created on first contact.
+
+    Packets that don't name a device belong to whatever device last named
+    itself from the same IP, or else to a provisional device named after
+    the IP. The first packet that names a device from that IP adopts the
+    provisional one, so audio that came before the first JSON packet ends
+    up with the board's data. Returns None once MAX_DEVICES are known and
+    none of the provisional ones has been idle long enough to expire.
+    """
+    ip = address[0] if address else None
+    retired = [] # devices dropped here, stopped after the lock is released
+    if device_id is None:
+        device_id = _address_devices.get(ip) or ip or DEFAULT_DEVICE
+    elif ip is not None and _address_devices.get(ip) != device_id:
+        with _devices_lock: # JSON and audio arrive on different threads
+            _address_devices[ip] = device_id
+            provisional = devices.get(ip)
+            if provisional is not None and not provisional.named:
+                retired += _adopt(provisional, device_id)
+    device = devices.get(device_id)
+    if device is None:
+        with _devices_lock:
+            device = devices.get(device_id)
+            if device is None and len(devices) >= MAX_DEVICES:
+                retired += _expire_devices()
+            if device is None and len(devices) < MAX_DEVICES:
+                log(f"New device {device_id} from {ip}")
+                device = DeviceState(device_id, address, named=device_id != ip)
+                if _loop is not None:
+                    device.start(_loop)
+                devices[device_id] = device
+    _stop_devices_later(retired)
+    if device is None:
+        global rejected_packets
+        rejected_packets += 1
+        if rejected_packets == 1 or rejected_packets % 1000 == 0:
+            log(f"Ignoring {device_id} from {ip}, {MAX_DEVICES} devices known ({rejected_packets} packets ignored)")
+        return None
+    device.packets += 1
+    device.last_seen = datetime.now()
+    return device
+
+def _adopt(provisional, device_id):
+    """
+    Give the provisional device of an IP its real name, or fold it into the known device of that name.
+
+    Returns:
+        List of the devices that were dropped and still have to be stopped
+    """
+    old = provisional.device_id
+    del devices[old]
+    retired = []
+    if device_id in devices:
+        retired.append(provisional)
+        log(f"Device {device_id} replaces provisional device {old}")
+    else:
+        provisional.device_id = device_id
+        provisional.named = True
+        provisional.wav_writer.base_filename = f"audio_recording_{device_id}" # from the next file on
+        devices[device_id] = provisional
+        log(f"Provisional device {old} is {device_id}")
+    rename_device(old, device_id)
+    return retired
+
+def _expire_devices():
+    """Drop provisional devices idle for DEVICE_EXPIRY_SECONDS, returns them to be stopped"""
+    cutoff = datetime.now() - timedelta(seconds=DEVICE_EXPIRY_SECONDS)
+    expired = [device for device in devices.values()
+               if not device.named and device.last_seen is not None and device.last_seen < cutoff]
+    for device in expired:
+        log(f"Expiring idle provisional device {device.device_id}")
+        del devices[device.device_id]
+        forget_device(device.device_id)
+    return expired
+
+def _stop_devices_later(retired):
+    """Stop dropped devices on a helper thread, flushing their WAV files must not hold up the receive path"""
+    if retired:
+        threading.Thread(target=lambda: [device.stop() for device in retired], name="device-stop", daemon=True).start()
+
+def start_devices(loop):
+    """Start the audio writers and streamers of known devices and of every device seen from now on"""
+    global _loop
+    with _devices_lock:
+        _loop = loop
+        for device in devices.values():
+            device.start(loop)
+
+def stop_devices():
+    global _loop
+    with _devices_lock:
+        _loop = None
+        for device in devices.values():
+            device.stop()
+
+def device_stats():
+    return {device_id: device.stats() for device_id, device in list(devices.items())}
+
+def add_audio_chunk(chunk, device):
+    """Store a chunk of int16 bytes or samples for the device"""
+    samples = chunk if isinstance(chunk, np.ndarray) else np.frombuffer(chunk, dtype=np.int16, count=len(chunk) // 2)
+    keep_audio(samples, device)
+    levels, spectrum = audio_rows(samples, device, np.datetime64(datetime.now(), 'ns'))
+    store_audio_rows(device, levels, spectrum)
+
+def keep_audio(samples, device):
+    """Copy the samples into the device's ring and hand them to its WAV writer and live streamer"""
+    start = device.audio_ring.total
+    device.audio_ring.write(samples) # chunk may be a reused receive buffer, the ring keeps the only copy
+    device.wav_writer.submit_range(start, device.audio_ring.total)
+    for view in device.audio_ring.segments(start, device.audio_ring.total):
+        device.audio_streamer.push(view)
+
+def audio_rows(samples, device, time):
+    """
+    Loudness readings and spectrogram rows of a chunk whose last sample arrived at time (datetime64).
+
+    Uses only the device's loudness meter and spectrogram state, so a
+    worker process can run it with its own DeviceState.
+
+    Returns:
+        Tuple of ((timestamps, DB columns) or None, (times, band levels) or None)
+    """
+    return calculate_db(samples, device, time), calculate_spectrum(samples, device, time)
+
+def store_audio_rows(device, levels, spectrum):
+    """Store the rows made by audio_rows"""
+    if levels is not None:
+        add_audio_metrics(levels[0], levels[1], device.device_id)
+    if spectrum is not None and len(spectrum[0]):
+        device.spectrogram.add_rows(*spectrum)
+
+def calculate_spectrum(samples, device, time):
+    """The chunk's complete STFT frames as (times, band levels), None on error"""
     try:
-        # Make sure we have enough data
-        if len(audio_buffer) < 1000:
-            log("Not enough audio samples for dB calculation")
-            return np.nan
-        time = datetime.now()
-        samples = np.frombuffer(audio_buffer[-1000:], np.int16)
-        max_amplitude = 2**15-1
-        squared = np.square(samples.astype(np.float64))
-        rms = np.sqrt(np.mean(squared))
-
-        if rms <= 0 or rms < 1e-10:
-            log(f"Audio signal too quiet for dB calculation (RMS: {rms})")
-            db = -60.0  # very low db == silence
-        else:
-            db = 20 * math.log10(rms / max_amplitude)
-            log(f"Calculated dB level: {db}")
-        db_data = {
-            'timestamp': time.isoformat()
+        return device.spectrogram.analyze(samples, time)
+    except Exception as e:
+        log(f"Error calculating spectrogram: {str(e)}")
+        return None
+
+def calculate_db(samples, device, time):
+    """Run the chunk through the device's loudness meter, (timestamps, columns) of the completed hops or None"""
+    try:
+        levels = device.loudness_meter.process(samples)
+        if len(levels['end']) == 0:
+            return None
+        delay_ns = (len(samples) - levels['end']) * (1e9 / AUDIO_SAMPLE_RATE)
+        timestamps = time - delay_ns.astype('timedelta64[ns]')
+        return timestamps, {
+            'DB': levels['rms'],
+            'DB_peak': levels['peak'],
+            'DB_leq': levels['leq']
         }
-        for key in KEYS_LIST:
-            if key == 'DB':
-                db_data[key] = db
-            else:
-                db_data[key] = np.nan
-        return add_data(db_data)
     except Exception as e:
         log(f"Error calculating dB level: {str(e)}")
-        return np.nan
\ No newline at end of file
+        return None
@@ -1,69 +1,632 @@
 import pandas as pd
-from datetime import datetime
-import os
-import json
+import numpy as np
 import threading
+import time
 from div import log
-from io import StringIO
+from storage import MemoryBackend, SQLiteBackend, DEFAULT_DEVICE, RETENTION_DAYS
 
-# Use a file as a shared data store for "slow" sensor data like temp, humid, tof
-DATA_FILE = "sensor_data.json"
-_lock = threading.Lock() #lock for single thread use of dataframe
+# In-memory column store for "slow" sensor data like temp, humid, tof, one partition per device.
+# Raw rows are also handed to a storage backend, which writes them from its own thread.
+STORAGE_BACKEND = "sqlite" # "sqlite" keeps raw history on disk, "memory" keeps nothing across restarts
+BUCKET_RESOLUTION = '1s' # readings are averaged per bucket, e.g. '1s', '10s', '1min'
+MAX_BUCKETS = 6 * 3600 # buckets kept per channel, 6 h at 1 s
+ROLLUP_TIERS = [ # (bucket resolution, buckets kept), finest first
+    (BUCKET_RESOLUTION, MAX_BUCKETS),
+    ('1min', 7 * 24 * 60), # a week
+    # rollups are rebuilt from raw rows on startup, which are only kept for
+    # RETENTION_DAYS, so the coarsest tier reaches back no further than that
+    ('1h', RETENTION_DAYS * 24)
+]
+MAX_POINTS = 1000 # default point budget for range_data
+SNAPSHOT_MAX_AGE = 0.5 # seconds a snapshot is shared for while new data keeps arriving
 
-COLUMNS = [
-    'timestamp', 
-    'Inside_temperature', 
+SENSOR_COLUMNS = [
+    'timestamp',
+    'Inside_temperature',
     'Outside_temperature',
     'Inside_humidity',
     'Outside_humidity',
-    'Time_of_flight',
-    'Vibration',
-    'DB'
+    'Time_of_flight'
+]
+AUDIO_COLUMNS = [
+    'timestamp',
+    'DB',
+    'DB_peak',
+    'DB_leq'
+]
+VIBRATION_COLUMNS = [ # one row per analysis window, see vibration.py
+    'timestamp',
+    'Vib_rms',
+    'Vib_peak',
+    'Vib_crest',
+    'Vib_freq',
+    'Vib_band1',
+    'Vib_band2',
+    'Vib_band3',
+    'Vib_band4'
 ]
+COLUMNS = SENSOR_COLUMNS + AUDIO_COLUMNS[1:] + VIBRATION_COLUMNS[1:] # all channels merged on read
 
-def _initialize_if_needed():
-    """Create the data file if it doesn't exist"""
-    if not os.path.exists(DATA_FILE):
-        df = pd.DataFrame(columns=COLUMNS)
-        with open(DATA_FILE, 'w') as f:
-            df.to_json(f, date_format='iso')
-
-def add_data(data_dict):
-    with _lock:
-        df = open_file()
-        new_row = pd.DataFrame([data_dict])
-        df = pd.concat([df, new_row], ignore_index=True)
-        df = group_by_timestamp(df)
-        save_to_file(df)
-    return True
+class RingBuffer:
+    """
+    Fixed-size column store with one numpy array per column.
+
+    Every row is written twice (slot i and i + capacity) so the retained rows
+    are always one contiguous slice, oldest first, and can be read as views.
+    The arrays are allocated by the first write, so a channel or tier that
+    never gets data costs no memory.
+    """
+    def __init__(self, columns, capacity):
+        self.columns = list(columns)
+        self.capacity = capacity
+        self._arrays = None # allocated by the first write
+        self._head = 0 # next slot to write
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _allocate(self):
+        self._arrays = {}
+        for col in self.columns:
+            if col == 'timestamp':
+                self._arrays[col] = np.zeros(2 * self.capacity, dtype='datetime64[ns]')
+            else:
+                self._arrays[col] = np.full(2 * self.capacity, np.nan)
+
+    def append(self, row):
+        """Write one row (dict keyed by column), overwriting the oldest when full"""
+        if self._arrays is None:
+            self._allocate()
+        i = self._head
+        for col in self.columns:
+            value = _to_timestamp(row.get(col)) if col == 'timestamp' else _to_float(row.get(col))
+            self._arrays[col][i] = value
+            self._arrays[col][i + self.capacity] = value
+        self._head = (i + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def extend(self, columns, n):
+        """Write n rows from a dict of equal-length arrays in one vectorized step"""
+        if n <= 0:
+            return
+        if self._arrays is None:
+            self._allocate()
+        if n > self.capacity: # only the newest rows fit
+            columns = {col: values[-self.capacity:] for col, values in columns.items()}
+            self._head = (self._head + n - self.capacity) % self.capacity
+            n = self.capacity
+        idx = (self._head + np.arange(n)) % self.capacity
+        for col in self.columns:
+            values = columns.get(col)
+            if values is None:
+                values = np.nan
+            self._arrays[col][idx] = values
+            self._arrays[col][idx + self.capacity] = values
+        self._head = (self._head + n) % self.capacity
+        self._size = min(self._size + n, self.capacity)
+
+    def insert(self, positions, columns, n):
+        """
+        Insert n rows before the given sorted logical positions (0 = oldest).
+
+        Rewrites the whole ring, so it is for the rare out-of-order row; when
+        the ring is full the oldest rows make room.
+        """
+        if self._arrays is None:
+            self._allocate()
+        rows = {}
+        for col in self.columns:
+            values = columns.get(col)
+            rows[col] = np.insert(self.column(col), positions, np.nan if values is None else values)
+        size = min(self._size + n, self.capacity)
+        for col, values in rows.items():
+            self._arrays[col][:size] = self._arrays[col][self.capacity:self.capacity + size] = values[-size:]
+        self._head = size % self.capacity
+        self._size = size
+
+    def update_last(self, updates):
+        """Combine scalars into the newest row, updates is a list of (column, value, op) with plain float ops"""
+        i = (self._head - 1) % self.capacity
+        j = i + self.capacity
+        for col, value, op in updates:
+            array = self._arrays[col]
+            array[i] = array[j] = op(float(array[i]), value)
+
+    def update_at(self, positions, updates):
+        """Combine values into existing rows at unique logical positions (0 = oldest), updates is a list of (column, values, op)"""
+        idx = (self._head - self._size + np.asarray(positions)) % self.capacity
+        mirror = idx + self.capacity
+        for col, values, op in updates:
+            arr = self._arrays[col]
+            arr[idx] = arr[mirror] = op(arr[idx], values)
+
+    def column(self, col):
+        """Zero-copy view of a column, oldest row first"""
+        if self._arrays is None:
+            return np.zeros(0, dtype='datetime64[ns]' if col == 'timestamp' else np.float64)
+        end = self._head + self.capacity
+        return self._arrays[col][end - self._size:end]
+
+AGGREGATES = ('sum', 'count', 'min', 'max')
+_MERGE_OPS = {'sum': np.add, 'count': np.add, 'min': np.fmin, 'max': np.fmax}
+
+# scalar versions for the single reading path, numpy ufuncs cost more than the math on one float
+def _scalar_add(old, new):
+    return old + new
+
+def _scalar_fmin(old, new):
+    return new if old != old or new < old else old # old != old: NaN, nothing seen yet
+
+def _scalar_fmax(old, new):
+    return new if old != old or new > old else old
+
+def _mean(sums, counts):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+class BucketStore:
+    """
+    Time buckets holding sum, count, min and max per column, kept in time order.
+
+    An insert groups its rows by bucket and only touches those buckets; the
+    mean is derived from sum and count when the buckets are read. Buckets
+    that are missing between existing ones (out-of-order data) are inserted
+    in place; only rows older than everything a full store holds are
+    counted in late_rows and dropped.
+    """
+    def __init__(self, columns, resolution=BUCKET_RESOLUTION, capacity=MAX_BUCKETS):
+        self.columns = list(columns)
+        self.values = [col for col in self.columns if col != 'timestamp']
+        self.resolution = pd.Timedelta(resolution).value # ns
+        self.late_rows = 0
+        self.since = None # older data than this was not loaded into memory
+        ring_columns = ['timestamp']
+        for col in self.values:
+            ring_columns += [f"{col}_{agg}" for agg in AGGREGATES]
+        self._ring = RingBuffer(ring_columns, capacity)
+
+    def __len__(self):
+        return len(self._ring)
+
+    def _newest_bucket(self):
+        """Id of the newest bucket, None while the store is empty"""
+        if len(self._ring) == 0:
+            return None
+        return int(self._ring.column('timestamp')[-1].astype(np.int64)) // self.resolution
+
+    def add(self, timestamps, columns):
+        """Accumulate rows given as a datetime64 array and a dict of value arrays"""
+        ids = np.asarray(timestamps, dtype='datetime64[ns]').view(np.int64) // self.resolution
+        newest = self._newest_bucket()
+        if len(ids) == 1 and (newest is None or ids[0] >= newest):
+            return self._add_one(int(ids[0]), columns)
+        buckets, inverse = np.unique(ids, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        starts = np.searchsorted(inverse[order], np.arange(len(buckets)))
+        aggregates = {}
+        for col in self.values:
+            values = columns.get(col)
+            if values is None:
+                continue
+            values = np.asarray(values, dtype=np.float64)
+            valid = ~np.isnan(values)
+            aggregates[col] = {
+                'sum': np.bincount(inverse, weights=np.where(valid, values, 0.0), minlength=len(buckets)),
+                'count': np.bincount(inverse, weights=valid, minlength=len(buckets)),
+                'min': np.fmin.reduceat(values[order], starts),
+                'max': np.fmax.reduceat(values[order], starts)
+            }
+        self.add_aggregates(buckets, aggregates, np.bincount(inverse))
+
+    def add_aggregates(self, buckets, aggregates, rows):
+        """
+        Merge pre-aggregated buckets into the store.
+
+        Args:
+            buckets: sorted bucket ids (timestamp ns // resolution)
+            aggregates: dict of column -> dict of AGGREGATES -> array per bucket
+            rows: number of source rows per bucket, for late_rows
+        """
+        # bucket timestamps are sorted, so finding the existing buckets is a binary search
+        existing = self._ring.column('timestamp').view(np.int64)
+        starts = buckets * self.resolution
+        positions = np.searchsorted(existing, starts)
+        found = positions < len(existing)
+        found[found] = existing[positions[found]] == starts[found]
+        if found.any():
+            self._ring.update_at(positions[found], [(f"{col}_{agg}", values[agg][found], _MERGE_OPS[agg])
+                                                    for col, values in aggregates.items() for agg in AGGREGATES])
+        new = ~found
+        if not new.any():
+            return
+        late = new & (positions < len(existing)) # missing buckets between existing ones
+        if late.any() and len(self._ring) == self._ring.capacity:
+            dropped = late & (positions == 0) # older than everything a full ring holds
+            self.late_rows += int(rows[dropped].sum())
+            new &= ~dropped
+            late &= ~dropped
+        block = {'timestamp': starts[new].view('datetime64[ns]')}
+        for col, values in aggregates.items():
+            for agg in AGGREGATES:
+                block[f"{col}_{agg}"] = values[agg][new]
+        for col in self.values:
+            if col not in aggregates: # nan for min/max is the default
+                block[col + '_sum'] = block[col + '_count'] = np.zeros(int(new.sum()))
+        if late.any(): # rare, e.g. reordered packets from a slow sender: insert in time order
+            self._ring.insert(positions[new], block, int(new.sum()))
+        elif new.any():
+            self._ring.extend(block, int(new.sum()))
+
+    def _add_one(self, bucket, columns):
+        """Scalar path for a single reading in the newest bucket or a new one"""
+        newest = self._newest_bucket()
+        values = {col: float(columns[col][0]) if col in columns else np.nan for col in self.values}
+        if bucket == newest:
+            updates = []
+            for col, value in values.items():
+                if value == value: # not NaN
+                    updates += [(col + '_sum', value, _scalar_add), (col + '_count', 1.0, _scalar_add),
+                                (col + '_min', value, _scalar_fmin), (col + '_max', value, _scalar_fmax)]
+            self._ring.update_last(updates)
+            return
+        row = {'timestamp': np.datetime64(bucket * self.resolution, 'ns')}
+        for col, value in values.items():
+            valid = not np.isnan(value)
+            row[col + '_sum'] = value if valid else 0.0
+            row[col + '_count'] = 1.0 if valid else 0.0
+            row[col + '_min'] = row[col + '_max'] = value
+        self._ring.append(row)
+
+    def covers(self, cutoff):
+        """True if every bucket at or after cutoff is held in memory"""
+        cutoff = np.datetime64(cutoff, 'ns')
+        if self.since is not None and cutoff < self.since:
+            return False
+        if len(self._ring) == self._ring.capacity: # oldest buckets have been overwritten
+            return cutoff >= self._ring.column('timestamp')[0]
+        return True
+
+    def query(self, cutoff=None, end=None, columns=None):
+        """
+        The buckets in [cutoff, end).
+
+        Args:
+            columns: value columns (bucket mean) or <column>_min/_max/_count, default all means
+
+        Returns:
+            Dict of 'timestamp' and each requested column. Means are computed
+            from sum and count here; the rest are zero-copy views that follow
+            later writes to the ring, so copy what needs to outlive the caller's lock.
+        """
+        timestamps = self._ring.column('timestamp')
+        start = 0 if cutoff is None else int(np.searchsorted(timestamps, np.datetime64(cutoff, 'ns')))
+        stop = len(timestamps) if end is None else int(np.searchsorted(timestamps, np.datetime64(end, 'ns')))
+        result = {'timestamp': timestamps[start:stop]}
+        for col in (self.values if columns is None else columns):
+            if col in self.values:
+                result[col] = _mean(self._ring.column(col + '_sum')[start:stop], self._ring.column(col + '_count')[start:stop])
+            else:
+                result[col] = self._ring.column(col)[start:stop]
+        return result
+
+class RollupStore:
+    """
+    The same channel kept at every resolution in ROLLUP_TIERS, finest first.
+
+    Each insert updates one bucket per tier, so long windows can be served
+    from a coarse tier at about the cost of a short one.
+    """
+    def __init__(self, columns, tiers=None):
+        self.columns = list(columns)
+        self.values = [col for col in self.columns if col != 'timestamp']
+        self.tiers = [BucketStore(columns, resolution, capacity) for resolution, capacity in (tiers or ROLLUP_TIERS)]
+
+    def __len__(self):
+        return len(self.tiers[0])
+
+    @property
+    def late_rows(self):
+        return self.tiers[0].late_rows
+
+    def add(self, timestamps, columns):
+        for tier in self.tiers:
+            tier.add(timestamps, columns)
+
+def aggregates_to_columns(aggregates, columns):
+    """Arrays for means and <column>_min/_max/_count from per-bucket sum/count/min/max arrays"""
+    result = {'timestamp': np.array(aggregates['timestamp'], dtype='datetime64[ns]')}
+    for col in columns:
+        base = _base_column(col)
+        if col == base:
+            result[col] = _mean(aggregates[col + '_sum'], aggregates[col + '_count'])
+        else:
+            result[col] = np.array(aggregates[col], dtype=np.float64)
+    return result
+
+def _base_column(col):
+    """Value column behind an aggregate name, Inside_temperature_max -> Inside_temperature"""
+    for suffix in ('_min', '_max', '_count'):
+        if col.endswith(suffix) and col[:-len(suffix)] in COLUMNS:
+            return col[:-len(suffix)]
+    return col
+
+def _to_timestamp(value):
+    if value is None:
+        return np.datetime64(pd.Timestamp.now())
+    return pd.Timestamp(value).to_datetime64()
+
+def _to_float(value):
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+_partitions = {} # device -> channels, see _channels()
+_partitions_lock = threading.Lock()
+_backend = MemoryBackend()
+_version = 0 # bumped by every write, invalidates snapshots
+_snapshots = {}
+_snapshot_lock = threading.Lock()
+_listeners = [] # called with (channel, timestamps, columns, device) after every write
+_rename_listeners = [] # called with (old, new) by rename_device
+_shared = None # SharedStore recent data is read from when ingestion runs in another process
+
+def _channels(device=DEFAULT_DEVICE, create=True):
+    """
+    [(table, store, lock)] for the sensor, audio and vibration channels of a device.
+
+    Each channel has its own lock, so devices and channels never wait on each
+    other. Returns None for an unknown device unless create is set.
+    """
+    channels = _partitions.get(device)
+    if channels is None and create:
+        with _partitions_lock:
+            channels = _partitions.get(device)
+            if channels is None:
+                channels = [('sensor', RollupStore(SENSOR_COLUMNS), threading.Lock()),
+                            ('audio', RollupStore(AUDIO_COLUMNS), threading.Lock()),
+                            ('vibration', RollupStore(VIBRATION_COLUMNS), threading.Lock())]
+                _partitions[device] = channels
+    return channels
+
+def devices():
+    """Every device with a partition, sorted"""
+    if _shared is not None:
+        return _shared.devices()
+    return sorted(_partitions)
 
-def open_file():
-    _initialize_if_needed()
+def rename_device(old, new):
+    """
+    Move a device's data to another name, e.g. a board that sent audio before its first packet named it.
+
+    Stored rows are renamed in the backend. In memory the partition is moved,
+    unless new already has one; then old's buckets are dropped from memory.
+    """
+    with _partitions_lock:
+        channels = _partitions.pop(old, None)
+        if channels is not None and new not in _partitions:
+            _partitions[new] = channels
+    _forget_snapshots(old)
     try:
-        with open(DATA_FILE, 'r') as f:
-            content = f.read()
-            if not content or content == '[]':
-                return pd.DataFrame(columns=COLUMNS)
-            df = pd.read_json(StringIO(content), convert_dates=['timestamp'])
-            # Ensure timestamp is datetime
-            if 'timestamp' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
-            return df    
+        _backend.rename_device(old, new)
     except Exception as e:
-        log(f"Error opening data file: {str(e)}")
-        return pd.DataFrame(columns=COLUMNS)
-    
-def save_to_file(df):     
-        if len(df) > 100:
-            df = df.tail(100)
-        with open(DATA_FILE, 'w') as f:
-            df.to_json(f, date_format='iso', orient='records')
-
-def group_by_timestamp(df):
+        log(f"Error renaming device {old} to {new} in storage: {str(e)}")
+    for callback in list(_rename_listeners):
+        try:
+            callback(old, new)
+        except Exception as e:
+            log(f"Error notifying rename listener: {str(e)}")
+
+def forget_device(device):
+    """Free a device's in-memory partition, its stored rows stay in the backend"""
+    with _partitions_lock:
+        _partitions.pop(device, None)
+    _forget_snapshots(device)
+
+def _forget_snapshots(device):
+    with _snapshot_lock:
+        for key in [key for key in _snapshots if key[0] == device]:
+            del _snapshots[key]
+
+def use_shared_store(store):
+    """Serve recent_data, snapshot and devices from a shared_store.SharedStore written by another process"""
+    global _shared
+    _shared = store
+
+def open_storage(kind=STORAGE_BACKEND, **options):
+    """Attach the persistent backend and rebuild every device's in-memory rollups from its history"""
+    global _backend
+    if kind == "sqlite":
+        _backend = SQLiteBackend({'sensor': SENSOR_COLUMNS, 'audio': AUDIO_COLUMNS,
+                                  'vibration': VIBRATION_COLUMNS}, **options)
+    else:
+        _backend = MemoryBackend()
+    try:
+        stored = _backend.devices()
+    except Exception as e:
+        log(f"Error listing stored devices: {str(e)}")
+        stored = []
+    for device in sorted(set(stored) | set(_partitions)):
+        _load_history(device)
+
+def _load_history(device):
+    now = pd.Timestamp.now()
+    for table, store, lock in _channels(device):
+        for tier in store.tiers:
+            start = (now - pd.Timedelta(tier.resolution) * tier._ring.capacity).to_datetime64()
+            try:
+                rollup = _backend.read_rollup(table, tier.values, start, None, tier.resolution, device)
+                with lock:
+                    if rollup is not None and len(rollup['timestamp']):
+                        buckets = rollup['timestamp'].view(np.int64) // tier.resolution
+                        aggregates = {col: {agg: rollup[f"{col}_{agg}"] for agg in AGGREGATES} for col in tier.values}
+                        tier.add_aggregates(buckets, aggregates, rollup['rows'])
+                    tier.since = start if rollup is not None else None
+            except Exception as e:
+                log(f"Error loading {table} history of {device}: {str(e)}")
+        log(f"Loaded {len(store)} {table} buckets of {device} from storage")
+
+def close_storage():
+    """Flush queued rows to the backend"""
+    _backend.close()
+
+def storage_status():
+    return {**_backend.stats(), "devices": devices()}
+
+def add_listener(callback):
+    """Call callback(channel, timestamps, columns, device) after each write, from the writing thread"""
+    _listeners.append(callback)
+
+def remove_listener(callback):
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+def add_rename_listener(callback):
+    """Call callback(old, new) when rename_device moves a device to another name"""
+    _rename_listeners.append(callback)
+
+def _notify(channel, timestamps, columns, device):
+    for callback in list(_listeners):
+        try:
+            callback(channel, timestamps, columns, device)
+        except Exception as e:
+            log(f"Error notifying {channel} listener: {str(e)}")
+
+def _has_values(row, columns):
+    return any(not np.isnan(_to_float(row.get(col))) for col in columns if col != 'timestamp')
+
+def _row_block(row, columns):
+    return {col: np.array([_to_float(row.get(col))]) for col in columns if col != 'timestamp'}
+
+def add_data(data_dict, device=DEFAULT_DEVICE):
+    """Add one row, sensor and audio values go to their own channels"""
+    timestamps = np.array([_to_timestamp(data_dict.get('timestamp'))])
+    if _has_values(data_dict, SENSOR_COLUMNS):
+        add_batch(timestamps, _row_block(data_dict, SENSOR_COLUMNS), device)
+    if _has_values(data_dict, AUDIO_COLUMNS):
+        add_audio_metrics(timestamps, _row_block(data_dict, AUDIO_COLUMNS), device)
+    return True
+
+def add_batch(timestamps, columns, device=DEFAULT_DEVICE):
+    """
+    Add a block of sensor readings in a single store write.
+
+    Args:
+        timestamps: datetime64 array, one entry per row
+        columns: dict of column name -> array with the same length as timestamps
+        device: partition the rows belong to
+    """
+    return _write(0, timestamps, columns, device)
+
+def add_audio_metrics(timestamps, columns, device=DEFAULT_DEVICE):
+    """Add a block of audio metrics (DB, DB_peak, DB_leq) to the audio channel"""
+    return _write(1, timestamps, columns, device)
+
+def add_vibration_features(timestamps, columns, device=DEFAULT_DEVICE):
+    """Add a block of vibration feature rows (VIBRATION_COLUMNS) to the vibration channel"""
+    return _write(2, timestamps, columns, device)
+
+def _write(channel, timestamps, columns, device):
+    n = len(timestamps)
+    if n == 0:
+        return True
+    global _version
+    table, store, lock = _channels(device)[channel]
+    with lock:
+        store.add(timestamps, columns)
+        _version += 1
+    _backend.append(table, timestamps, columns, device)
+    _notify(table, timestamps, columns, device)
+    return True
+
+def _pick_tier(cutoff, end, max_points, channels):
+    """
+    Index into ROLLUP_TIERS for a window and whether memory holds all of it.
+
+    Picks the finest resolution whose bucket count for the window fits in
+    max_points (the finest one when max_points is None), then moves to coarser
+    tiers until one reaches back to cutoff in every channel.
+    """
+    span = (np.datetime64(end or pd.Timestamp.now(), 'ns') - np.datetime64(cutoff, 'ns')).astype(np.int64)
+    index = len(ROLLUP_TIERS) - 1
+    for i, (resolution, capacity) in enumerate(ROLLUP_TIERS):
+        if max_points is None or span / pd.Timedelta(resolution).value <= max_points:
+            index = i
+            break
+    for i in range(index, len(ROLLUP_TIERS)):
+        if all(store.tiers[i].covers(cutoff) for table, store, lock in channels):
+            return i, True
+    return index, False
+
+def _window(table, store, lock, tier, in_memory, cutoff, end, columns, device):
+    """Frame of one channel's columns at the resolution of ROLLUP_TIERS[tier]"""
+    rollup = None
+    if not in_memory:
+        rollup = _backend.read_rollup(table, store.values, cutoff, end, store.tiers[tier].resolution, device)
+    if rollup is None: # no persistent history, serve what memory has
+        with lock:
+            return pd.DataFrame(store.tiers[tier].query(cutoff, end, columns)) # copies the views
+    return pd.DataFrame(aggregates_to_columns(rollup, columns))
+
+def _merged_window(cutoff, end=None, max_points=None, extremes=False, columns=None, device=DEFAULT_DEVICE):
+    """Requested columns of a device's channels joined on their bucket timestamps"""
+    columns = COLUMNS[1:] if columns is None else [col for col in columns if col != 'timestamp']
+    if extremes:
+        columns = columns + [f"{col}_{agg}" for col in columns for agg in ('min', 'max', 'count')]
+    channels = _channels(device, create=False)
+    if channels is None: # nothing was ever written for this device
+        return pd.DataFrame(columns=['timestamp'] + columns)
+    tier, in_memory = _pick_tier(cutoff, end, max_points, channels)
+    df = None
+    for table, store, lock in channels:
+        wanted = [col for col in columns if _base_column(col) in store.values]
+        if not wanted:
+            continue # only materialize channels that were asked for
+        frame = _window(table, store, lock, tier, in_memory, cutoff, end, wanted, device)
+        df = frame if df is None else pd.merge(df, frame, on='timestamp', how='outer', sort=True)
+    if df is None:
+        return pd.DataFrame(columns=['timestamp'] + columns)
+    return df.reindex(columns=['timestamp'] + columns)
+
+def query(start, end=None, columns=('Inside_temperature',), max_points=None, device=DEFAULT_DEVICE):
+    """
+    Bucket values between start and end as numpy arrays, without building a DataFrame.
+
+    All columns (means, or <column>_min/_max/_count) must come from one channel.
+    The start/end offsets are found with searchsorted over the time-sorted
+    buckets and, when the window is in memory, the _min/_max/_count arrays are
+    views into the store: they change with later writes, so copy what you keep.
+
+    Returns:
+        Dict of 'timestamp' and each requested column
+    """
+    start = np.datetime64(pd.Timestamp(start), 'ns')
+    end = None if end is None else np.datetime64(pd.Timestamp(end), 'ns')
+    columns = list(columns)
+    channels = _channels(device, create=False)
+    if channels is None: # nothing was ever written for this device
+        return {'timestamp': np.zeros(0, dtype='datetime64[ns]'), **{col: np.zeros(0) for col in columns}}
+    tier, in_memory = _pick_tier(start, end, max_points, channels)
+    for table, store, lock in channels:
+        if all(_base_column(col) in store.values for col in columns):
+            rollup = None
+            if not in_memory:
+                rollup = _backend.read_rollup(table, store.values, start, end, store.tiers[tier].resolution, device)
+            if rollup is not None:
+                return aggregates_to_columns(rollup, columns)
+            with lock:
+                return store.tiers[tier].query(start, end, columns)
+    raise ValueError(f"Columns {columns} are not all in one channel")
+
+def group_by_timestamp(df, columns=COLUMNS):
+    """Average a frame of raw rows per bucket (the in-memory store does this on insert)"""
     if df is None or df.empty:
-        return pd.DataFrame(columns=COLUMNS)
+        return pd.DataFrame(columns=columns)
     df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df['timestamp'] = df['timestamp'].dt.floor('s') #round time to nearest second
+    df['timestamp'] = df['timestamp'].dt.floor(BUCKET_RESOLUTION) #round time down to the bucket
     try:
         aggregations = {col: 'mean' for col in df.columns if col != 'timestamp'}
         merged_df = df.groupby('timestamp', as_index=False).agg(aggregations)
@@ -72,23 +635,56 @@ def group_by_timestamp(df):
         log(f"Error in grouping data: {str(e)}")
         return df
 
-def recent_data(minutes=5):
-    """Get data from the last N minutes"""
+def recent_data(minutes=5, max_points=None, columns=None, device=DEFAULT_DEVICE):
+    """Get a device's data (all COLUMNS or just columns) from the last N minutes, at the finest resolution that fits in max_points"""
     try:
-        with _lock:
-            df = open_file()
-            if df is None:
-                log("DataFrame is None, returning empty DataFrame")
-                return pd.DataFrame(columns=COLUMNS)
-            if df.empty:
-                return df
-            now = pd.Timestamp.now() # Filter for recent data
-            cutoff = now - pd.Timedelta(minutes=minutes)
-            if not df.empty and 'timestamp' in df.columns:
-                df = df[df['timestamp'] >= cutoff]
-            
-            log(f"Returning dataframe with {len(df)} rows")
-            return df
+        now = pd.Timestamp.now() # Filter for recent data
+        cutoff = (now - pd.Timedelta(minutes=minutes)).to_datetime64()
+        if _shared is not None:
+            df = _shared.recent_data(minutes, max_points, columns, device)
+        else:
+            df = _merged_window(cutoff, max_points=max_points, columns=columns, device=device)
+        log(f"Returning dataframe with {len(df)} rows")
+        return df
     except Exception as e:
         log(f"Error in recent_data: {str(e)}")
-        return pd.DataFrame(columns=COLUMNS)
\ No newline at end of file
+        return pd.DataFrame(columns=COLUMNS)
+
+def range_data(start, end=None, max_points=MAX_POINTS, extremes=False, columns=None, device=DEFAULT_DEVICE):
+    """
+    Get data between start and end (default now) from the rollup tier that fits the point budget.
+
+    With extremes the frame also has <column>_min, _max and _count per bucket.
+    """
+    try:
+        start = np.datetime64(pd.Timestamp(start), 'ns')
+        end = None if end is None else np.datetime64(pd.Timestamp(end), 'ns')
+        return _merged_window(start, end, max_points, extremes, columns, device)
+    except Exception as e:
+        log(f"Error in range_data: {str(e)}")
+        return pd.DataFrame(columns=COLUMNS)
+
+def data_version():
+    """Counter that changes whenever data is written"""
+    if _shared is not None:
+        return _shared.generation()
+    return _version
+
+def snapshot(minutes=5, columns=None, device=DEFAULT_DEVICE):
+    """
+    recent_data() shared by every caller, e.g. all dashboard callbacks and clients.
+
+    A cached frame is reused until data has been written since it was taken
+    and it is older than SNAPSHOT_MAX_AGE, so one dashboard tick costs one
+    read however many graphs and viewers ask. Treat the frame as read-only.
+    """
+    key = (device, minutes, None if columns is None else tuple(columns))
+    with _snapshot_lock: # concurrent callers wait for one read instead of doing their own
+        cached = _snapshots.get(key)
+        now = time.monotonic()
+        version = data_version()
+        if cached is not None and (cached[0] == version or now - cached[1] < SNAPSHOT_MAX_AGE):
+            return cached[2]
+        df = recent_data(minutes, columns=columns, device=device)
+        _snapshots[key] = (version, now, df)
+        return df
@@ -0,0 +1,105 @@
+import numpy as np
+
+DEVICE_TIME_WRAP = 2**32 # device clocks are uint32 millisecond counters
+MIN_DRIFT_SPAN = 10.0 # seconds of device time before the drift is estimated, offset only until then
+MAX_DRIFT = 1e-3 # fitted drift is clamped to +-1000 ppm, anything more is jitter
+RESET_PERIODS = 8 # a device time further back than this many packet periods means the board restarted
+RESET_LATE_PACKETS = 3 # this many late packets in a row also mean a restart, one that came back close to the old time
+
+class DeviceClock:
+    """
+    Maps a board's own clock onto server time.
+
+    Every packet that carries a device time adds a point (device time of its
+    last sample, arrival time). A least-squares line through the last
+    `points` of them gives offset and drift of the board's oscillator, so
+    sample times follow the board's clock while network jitter averages out.
+    A packet a little older than the newest one was reordered on the way and
+    is timestamped from the current fit without changing it. A device time
+    that jumps back by more than a few packet periods (or keeps coming in
+    behind) means the board restarted, and the fit starts over.
+    """
+    def __init__(self, points=64):
+        self.points = points
+        self.resets = 0
+        self._device = np.zeros(points) # seconds since the first packet, unwrapped
+        self._arrival = np.zeros(points) # seconds since the first packet
+        self._n = 0
+        self._index = 0
+        self._origin_device = None # device time in ms of the first packet
+        self._origin_arrival = None # datetime64[ns] of the first packet
+        self._last = None # newest device time in ms, unwrapped
+        self._period_ms = 1000.0 # smoothed device time between packets
+        self._late = 0 # late packets in a row
+        self._slope = 1.0
+        self._intercept = 0.0
+
+    def _unwrap(self, t0_ms):
+        """Unwrapped device time in ms and whether the packet is older than the newest one"""
+        if self._last is None:
+            self._last = t0_ms
+            return t0_ms, False
+        half = DEVICE_TIME_WRAP // 2
+        step = (t0_ms - self._last + half) % DEVICE_TIME_WRAP - half # signed, across the wrap
+        if step >= 0:
+            if step > 0:
+                self._period_ms += 0.1 * (min(step, RESET_PERIODS * self._period_ms) - self._period_ms)
+            self._last += step
+            self._late = 0
+            return self._last, False
+        self._late += 1
+        if -step > RESET_PERIODS * self._period_ms or self._late >= RESET_LATE_PACKETS:
+            self.reset()
+            self._last = t0_ms
+            return t0_ms, False
+        return self._last + step, True
+
+    def reset(self):
+        self.resets += 1
+        self._n = self._index = self._late = 0
+        self._origin_device = self._origin_arrival = self._last = None
+        self._slope, self._intercept = 1.0, 0.0
+
+    def timestamps(self, t0_ms, rate, length, arrival):
+        """
+        Server timestamps of one block of samples.
+
+        Args:
+            t0_ms: Device time of the first sample in milliseconds
+            rate: Samples per second
+            length: Number of samples in the block
+            arrival: Arrival time of the packet (datetime)
+
+        Returns:
+            datetime64 array of timestamps
+        """
+        arrival = np.datetime64(arrival, 'ns')
+        t0_ms, late = self._unwrap(int(t0_ms))
+        if self._origin_device is None:
+            self._origin_device, self._origin_arrival = t0_ms, arrival
+        device_times = (t0_ms - self._origin_device) / 1000 + np.arange(length) / rate
+        if not late: # a reordered packet arrived late, its arrival time says nothing about the clock
+            self._fit(device_times[-1], (arrival - self._origin_arrival).astype(np.int64) / 1e9)
+        offsets = self._intercept + self._slope * device_times
+        return self._origin_arrival + (offsets * 1e9).astype('timedelta64[ns]')
+
+    def _fit(self, device_time, arrival_time):
+        self._device[self._index] = device_time
+        self._arrival[self._index] = arrival_time
+        self._index = (self._index + 1) % self.points
+        self._n = min(self._n + 1, self.points)
+        x = self._device[:self._n]
+        y = self._arrival[:self._n]
+        x_mean, y_mean = x.mean(), y.mean()
+        if x.max() - x.min() >= MIN_DRIFT_SPAN:
+            slope = ((x - x_mean) * (y - y_mean)).sum() / ((x - x_mean) ** 2).sum()
+            self._slope = min(max(slope, 1 - MAX_DRIFT), 1 + MAX_DRIFT)
+        self._intercept = y_mean - self._slope * x_mean
+
+    def stats(self):
+        return {
+            "points": self._n,
+            "drift_ppm": float((self._slope - 1) * 1e6),
+            "period_ms": float(self._period_ms),
+            "resets": self.resets
+        }
@@ -0,0 +1,67 @@
+import numpy as np
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets, keeps the points that carry the shape of the line.
+
+    Returns:
+        Sorted indices of the n_out points to keep (all indices if there are fewer)
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # first and last point are always kept, the rest is split into n_out - 2 buckets
+    edges = (np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.intp) + 1
+    edges[-1] = n - 1
+    counts = np.diff(edges)
+    avg_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[:-1], edges[:-1]) / counts, y[-1])
+
+    keep = np.empty(n_out, dtype=np.intp)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # doubled triangle area between the last kept point, each candidate and the next bucket's average
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+def minmax(y, n_out):
+    """
+    Min and max of each of n_out / 2 buckets, so no peak or dip is lost.
+
+    Returns:
+        Sorted indices of at most n_out points to keep (all indices if there are fewer)
+    """
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    edges = np.linspace(0, n, n_out // 2 + 1).astype(np.intp)
+    bucket = np.repeat(np.arange(len(edges) - 1), np.diff(edges))
+    order = np.lexsort((y, bucket)) # by bucket, then by value
+    return np.unique(np.concatenate((order[edges[:-1]], order[edges[1:] - 1])))
+
+def downsample(timestamps, values, max_points, method="lttb"):
+    """
+    Reduce a trace to at most max_points, gaps (NaN) are dropped first.
+
+    Returns:
+        Tuple of (timestamps, values) arrays
+    """
+    timestamps = np.asarray(timestamps)
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    if not valid.all():
+        timestamps, values = timestamps[valid], values[valid]
+    if max_points is None or len(values) <= max_points:
+        return timestamps, values
+    if method == "minmax":
+        keep = minmax(values, max_points)
+    else:
+        x = timestamps.astype('datetime64[ns]').view(np.int64)
+        keep = lttb((x - x[0]).astype(np.float64), values, max_points)
+    return timestamps[keep], values[keep]
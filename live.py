@@ -0,0 +1,259 @@
+import asyncio
+import json
+import struct
+import warnings
+from collections import deque
+import numpy as np
+import database
+from div import log
+
+LIVE_QUEUE_SIZE = 32 # messages waiting per client before updates are coalesced
+LIVE_MAX_ROWS = 600 # rows per channel kept in a coalesced update, oldest go first
+
+with warnings.catch_warnings(): # deprecated in 3.11, gone in 3.13, ADPCM is skipped without it
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:
+        audioop = None
+
+AUDIO_FRAME_SAMPLES = 1600 # 50 ms at 32018 Hz
+AUDIO_BUFFER_FRAMES = 100 # shared history, a listener further behind skips ahead
+AUDIO_JITTER_FRAMES = 4 # new and lagging listeners start this many frames behind live
+AUDIO_CODECS = ("pcm", "adpcm") if audioop is not None else ("pcm",)
+AUDIO_FRAME_HEADER = struct.Struct("<IhBB") # seq, ADPCM predictor, ADPCM step index, codec
+
+class LiveClient:
+    """
+    One subscriber's outbox.
+
+    Messages go on a bounded queue. Once it is full the client is treated as
+    slow: further rows are merged into a single pending update per channel
+    and device (capped at max_rows, newest kept), so a stalled socket costs
+    a fixed amount of memory and never blocks ingestion.
+    """
+    def __init__(self, channels, devices=None, queue_size=LIVE_QUEUE_SIZE, max_rows=LIVE_MAX_ROWS):
+        self.channels = set(channels)
+        self.devices = None if devices is None else set(devices) # None: every device
+        self.max_rows = max_rows
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._pending = {} # (channel, device) -> coalesced payload
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped_rows = 0
+
+    def put(self, message):
+        """Queue a (payload, text) message, runs on the event loop"""
+        if not self._pending and not self._queue.full():
+            self._queue.put_nowait(message)
+            return
+        payload = message[0]
+        key = (payload["channel"], payload["device"])
+        self._pending[key] = self._merge(self._pending.get(key), payload)
+        self.coalesced += 1
+
+    def _merge(self, pending, payload):
+        if pending is None:
+            return dict(payload)
+        n_old, n_new = len(pending["timestamp"]), len(payload["timestamp"])
+        keys = (set(pending) | set(payload)) - {"channel", "device"}
+        merged = {key: pending.get(key, [None] * n_old) + payload.get(key, [None] * n_new) for key in keys}
+        extra = len(merged["timestamp"]) - self.max_rows
+        if extra > 0:
+            self.dropped_rows += extra
+            merged = {key: values[extra:] for key, values in merged.items()}
+        merged["channel"] = payload["channel"]
+        merged["device"] = payload["device"]
+        return merged
+
+    async def get(self):
+        """Next message as JSON text, queued updates first, then the coalesced ones"""
+        if self._queue.empty() and self._pending:
+            key = next(iter(self._pending))
+            text = json.dumps(self._pending.pop(key))
+        else:
+            payload, text = await self._queue.get()
+        self.sent += 1
+        return text
+
+    def stats(self):
+        return {
+            "channels": sorted(self.channels),
+            "devices": None if self.devices is None else sorted(self.devices),
+            "sent": self.sent,
+            "queued": self._queue.qsize(),
+            "coalesced": self.coalesced,
+            "dropped_rows": self.dropped_rows
+        }
+
+class LiveHub:
+    """
+    Fans out every row written to the database to the subscribed clients.
+
+    The database calls publish() from whatever thread wrote the rows; the
+    work is handed to the event loop with call_soon_threadsafe, where each
+    block is converted and JSON encoded once for all clients.
+    """
+    def __init__(self):
+        self.clients = set()
+        self.published = 0
+        self._loop = None
+
+    def start(self, loop):
+        self._loop = loop
+        database.add_listener(self.publish)
+
+    def stop(self):
+        database.remove_listener(self.publish)
+        self._loop = None
+
+    def subscribe(self, channels=('sensor', 'audio', 'vibration'), devices=None):
+        client = LiveClient(channels, devices)
+        self.clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        self.clients.discard(client)
+
+    def publish(self, channel, timestamps, columns, device):
+        loop = self._loop
+        if loop is None or not self.clients:
+            return
+        try:
+            loop.call_soon_threadsafe(self._dispatch, channel, timestamps, columns, device)
+        except RuntimeError: # loop already closed during shutdown
+            pass
+
+    def _dispatch(self, channel, timestamps, columns, device):
+        clients = [client for client in self.clients
+                   if channel in client.channels and (client.devices is None or device in client.devices)]
+        if not clients:
+            return
+        try:
+            payload = {"channel": channel,
+                       "device": device,
+                       "timestamp": np.datetime_as_string(np.asarray(timestamps, dtype='datetime64[ms]')).tolist()}
+            for col, values in columns.items():
+                values = np.asarray(values, dtype=np.float64)
+                payload[col] = np.where(np.isnan(values), None, values).tolist() # NaN is not valid JSON
+            message = (payload, json.dumps(payload))
+        except Exception as e:
+            log(f"Error encoding live {channel} update: {str(e)}")
+            return
+        self.published += 1
+        for client in clients:
+            client.put(message)
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "clients": [client.stats() for client in self.clients]
+        }
+
+class AudioStreamer:
+    """
+    Fans the audio stream out to any number of listeners.
+
+    Incoming chunks are cut into fixed frames and each frame is encoded once
+    per codec in use into a shared buffer of the last buffer_frames frames.
+    Listeners only hold a cursor into that buffer, so N listeners cost one
+    encode, and a listener that can't keep up jumps forward instead of
+    holding data back.
+
+    Frames are AUDIO_FRAME_HEADER followed by little-endian int16 samples
+    ("pcm") or 4-bit IMA ADPCM ("adpcm", first sample in the high nibble).
+    The header carries the ADPCM predictor and step index at the start of
+    the frame, so a decoder can join at any frame.
+    """
+    def __init__(self, sample_rate, frame_samples=AUDIO_FRAME_SAMPLES,
+                 buffer_frames=AUDIO_BUFFER_FRAMES, jitter_frames=AUDIO_JITTER_FRAMES):
+        self.sample_rate = sample_rate
+        self.frame_samples = frame_samples
+        self.jitter_frames = jitter_frames
+        self.frames = 0
+        self.skipped = 0
+        self._buffers = {codec: deque(maxlen=buffer_frames) for codec in AUDIO_CODECS} # (seq, frame)
+        self._listeners = {codec: 0 for codec in AUDIO_CODECS}
+        self._partial = np.zeros(0, dtype=np.int16)
+        self._adpcm_state = None
+        self._loop = None
+        self._new_frame = None
+
+    def start(self, loop):
+        self._loop = loop
+        self._new_frame = asyncio.Event()
+
+    def stop(self):
+        self._loop = None
+
+    def push(self, samples):
+        """
+        Hand an int16 array to the streamer, from any thread.
+
+        The array is read on the event loop, so it may be a view of the audio
+        ring but must not be overwritten before the loop gets to it.
+        """
+        loop = self._loop
+        if loop is None or not any(self._listeners.values()):
+            return
+        try:
+            loop.call_soon_threadsafe(self._append, samples)
+        except RuntimeError: # loop already closed during shutdown
+            pass
+
+    def _append(self, samples):
+        samples = np.concatenate((self._partial, samples))
+        n = len(samples) // self.frame_samples * self.frame_samples
+        for start in range(0, n, self.frame_samples):
+            self._encode(samples[start:start + self.frame_samples])
+        self._partial = samples[n:]
+        if n:
+            event, self._new_frame = self._new_frame, asyncio.Event()
+            event.set() # wakes every listener waiting on this frame
+
+    def _encode(self, frame):
+        pcm = frame.astype('<i2').tobytes()
+        for codec, listeners in self._listeners.items():
+            if not listeners:
+                continue
+            if codec == "adpcm":
+                predictor, index = self._adpcm_state or (0, 0)
+                data, self._adpcm_state = audioop.lin2adpcm(pcm, 2, self._adpcm_state)
+                header = AUDIO_FRAME_HEADER.pack(self.frames, predictor, index, 1)
+            else:
+                data, header = pcm, AUDIO_FRAME_HEADER.pack(self.frames, 0, 0, 0)
+            self._buffers[codec].append((self.frames, header + data))
+        self.frames += 1
+
+    async def listen(self, codec="pcm"):
+        """Yield encoded frames from just behind live, forever"""
+        if codec not in self._buffers:
+            raise ValueError(f"Unknown audio codec {codec}, expected one of {AUDIO_CODECS}")
+        frames = self._buffers[codec]
+        if self._listeners[codec] == 0:
+            frames.clear() # stale since the codec was last in use
+        self._listeners[codec] += 1
+        try:
+            cursor = max(frames[0][0] if frames else self.frames, self.frames - self.jitter_frames)
+            while True:
+                if frames and cursor < frames[0][0]: # fell out of the buffer
+                    skip_to = max(frames[0][0], self.frames - self.jitter_frames)
+                    self.skipped += max(0, skip_to - cursor)
+                    cursor = skip_to
+                if frames and cursor <= frames[-1][0]:
+                    yield frames[cursor - frames[0][0]][1]
+                    cursor += 1
+                else:
+                    await self._new_frame.wait()
+        finally:
+            self._listeners[codec] -= 1
+
+    def stats(self):
+        return {
+            "codecs": list(AUDIO_CODECS),
+            "frames": self.frames,
+            "listeners": dict(self._listeners),
+            "skipped_frames": self.skipped
+        }
+
+hub = LiveHub()
@@ -1,35 +1,64 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.wsgi import WSGIMiddleware
 from pydantic import BaseModel
 #from typing import List, Optional
 #import pandas as pd
-import time
-import threading
 import database
+import data_process
+import live
 from div import log
 import dashboard
-from UDP_recieve import UDP_main_json, UDP_main_audio
+from UDP_recieve import start_udp_receivers
+import workers
+import shared_store
 
 app = FastAPI(title="ECHO Monitor API")
 
-udp_json_thread = None
-udp_audio_thread = None
+# True: ingestion runs in its own process (`python shared_store.py`) and this
+# process only serves the API and dashboard from the shared store. Live push,
+# live audio and range queries need in-process ingestion.
+SEPARATE_INGEST = False
+
+udp_receivers = []
+
+@app.on_event("startup")
+async def startup_storage():
+    if SEPARATE_INGEST:
+        log(f"Reading sensor data from shared store {shared_store.SHARED_STORE_NAME}...")
+        database.use_shared_store(shared_store.SharedStore())
+        return
+    log("Opening sensor data storage...")
+    database.open_storage()
 
 @app.on_event("startup")
-async def startup_json_receiver():
-    global udp_json_thread
-    log("Starting UDP receiver thread...")
-    udp_json_thread = threading.Thread(target=UDP_main_json, daemon=True)
-    udp_json_thread.start()
-    time.sleep(0.5) 
+async def startup_live():
+    live.hub.start(asyncio.get_running_loop())
+    data_process.start_devices(asyncio.get_running_loop())
+
 @app.on_event("startup")
-async def startup_audio_reciever():
-    global udp_json_thread
-    log("Starting UDP receiver thread...")
-    udp_json_thread = threading.Thread(target=UDP_main_audio, daemon=True)
-    udp_json_thread.start()
-    time.sleep(0.5)
+async def startup_udp_receivers():
+    if SEPARATE_INGEST:
+        return
+    log("Starting UDP receivers...")
+    if workers.INGEST_WORKERS > 0:
+        udp_receivers.append(workers.IngestWorkers(workers.INGEST_WORKERS).start())
+    else:
+        udp_receivers.extend(await start_udp_receivers())
+
+@app.on_event("shutdown")
+async def shutdown_udp_receivers():
+    log("Stopping UDP receivers...")
+    for receiver in udp_receivers:
+        receiver.close()
+    udp_receivers.clear()
+    data_process.stop_devices()
+    live.hub.stop()
 
+@app.on_event("shutdown")
+async def shutdown_storage():
+    log("Flushing sensor data storage...")
+    database.close_storage()
 
 @app.get("/")
 def read_root():
@@ -37,12 +66,92 @@ def read_root():
 
 @app.get("/data-status")
 def data_status():
-    df = database.recent_data()
     return {
-        "rows": len(df),
-        "columns": list(df.columns) if not df.empty else []
+        "rows": {device: len(database.snapshot(device=device)) for device in database.devices()},
+        "columns": database.COLUMNS,
+        "storage": database.storage_status()
     }
 
+@app.get("/udp-status")
+def udp_status():
+    return {receiver.name: receiver.stats() for receiver in udp_receivers}
+
+@app.get("/audio-status")
+def audio_status():
+    return data_process.device_stats()
+
+@app.get("/live-status")
+def live_status():
+    return live.hub.stats()
+
+async def send_until_disconnect(websocket, next_message, send):
+    """
+    Send next_message() results with send() until the client goes away.
+
+    The handlers only ever send, so the receive side is raced against the
+    next message; otherwise a client that leaves while nothing is being sent
+    would stay subscribed forever. Messages from the client are ignored.
+    """
+    receive = asyncio.ensure_future(websocket.receive())
+    message = asyncio.ensure_future(next_message())
+    try:
+        while True:
+            done, pending = await asyncio.wait({receive, message}, return_when=asyncio.FIRST_COMPLETED)
+            if receive in done:
+                if receive.result()["type"] == "websocket.disconnect":
+                    return
+                receive = asyncio.ensure_future(websocket.receive())
+            if message in done:
+                await send(message.result())
+                message = asyncio.ensure_future(next_message())
+    finally:
+        receive.cancel()
+        message.cancel()
+        await asyncio.gather(receive, message, return_exceptions=True) # let a cancelled generator finish unwinding
+
+@app.websocket("/ws/live")
+async def live_socket(websocket: WebSocket, channels: str = "sensor,audio,vibration", devices: str = None):
+    """Pushes every block of new rows as JSON: {"channel", "device", "timestamp": [...], "<column>": [...]}"""
+    await websocket.accept()
+    client = live.hub.subscribe(channels.split(","), None if devices is None else devices.split(","))
+    try:
+        await send_until_disconnect(websocket, client.get, websocket.send_text)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        log(f"Error in live socket: {str(e)}")
+    finally:
+        live.hub.unsubscribe(client)
+
+@app.websocket("/ws/audio")
+async def audio_socket(websocket: WebSocket, codec: str = "adpcm", device: str = None):
+    """
+    Live audio of one device (default the first one): one JSON text message
+    describing the stream, then binary frames as produced by live.AudioStreamer.
+    """
+    await websocket.accept()
+    if device is None and data_process.devices:
+        device = sorted(data_process.devices)[0]
+    state = data_process.devices.get(device)
+    if state is None:
+        await websocket.send_json({"error": f"Unknown device {device}"})
+        await websocket.close()
+        return
+    streamer = state.audio_streamer
+    if codec not in live.AUDIO_CODECS:
+        codec = "pcm"
+    await websocket.send_json({"sample_rate": streamer.sample_rate, "codec": codec,
+                               "frame_samples": streamer.frame_samples, "device": device})
+    frames = streamer.listen(codec)
+    try:
+        await send_until_disconnect(websocket, frames.__anext__, websocket.send_bytes)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        log(f"Error in audio socket: {str(e)}")
+    finally:
+        await frames.aclose()
+
 app.mount("/dashboard", WSGIMiddleware(dashboard.server))
 # Run the app
 if __name__ == "__main__":
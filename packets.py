@@ -0,0 +1,127 @@
+import struct
+import numpy as np
+
+# Binary sensor packet, the compact alternative to JSON on port 6002.
+#
+#   offset  size  field
+#   0       2     magic b"EC"
+#   2       1     version (1)
+#   3       1     flags (reserved, 0)
+#   4       2     device id, uint16 -> "dev001" style name
+#   6       4     sequence number, uint32, +1 per packet
+#   10      2     sample count n per column, uint16
+#   12      2     key mask, bit i set when BINARY_KEYS[i] is present
+#   14      2*n   one little-endian int16 column per set bit, in bit order
+#
+# Version 2 inserts the device clock between the header and the columns:
+#
+#   14      4     device time of the first sample, uint32 milliseconds
+#   18      4     sample rate, float32 samples per second
+#
+# Values are the same raw 16 bit integers the JSON packets carry (scaled with
+# SCALE_DIVISORS on the server); MISSING_VALUE marks a missing reading.
+# A JSON packet always starts with "{", so the format is detected per packet.
+BINARY_MAGIC = b"EC"
+BINARY_VERSION = 1
+BINARY_CLOCK_VERSION = 2
+BINARY_HEADER = struct.Struct("<2sBBHIHH")
+BINARY_CLOCK = struct.Struct("<If")
+BINARY_KEYS = ( # bit order of the key mask, append only
+    "Vibration",
+    "Inside_temperature",
+    "Outside_temperature",
+    "Inside_humidity",
+    "Outside_humidity",
+    "Time_of_flight"
+)
+MISSING_VALUE = -32768
+
+def is_binary_packet(data):
+    return bytes(data[:2]) == BINARY_MAGIC
+
+def device_name(device_id):
+    """Device name for a numeric device id, 1 -> dev001"""
+    return f"dev{device_id:03d}"
+
+def checked_clock(t0, rate):
+    """(device time ms, rate) as floats, None unless both are finite and the rate is positive"""
+    try:
+        t0, rate = float(t0), float(rate)
+    except (TypeError, ValueError):
+        return None
+    if not (np.isfinite(t0) and np.isfinite(rate) and rate > 0):
+        return None
+    return t0, rate
+
+def decode_binary_packet(data):
+    """
+    Decode a binary sensor packet without copying the samples.
+
+    Returns:
+        Tuple of (device name, sequence number, dict of key -> int16 array view,
+        (device time ms, sample rate) or None), keys missing from the key mask
+        are left out
+    """
+    if len(data) < BINARY_HEADER.size:
+        raise ValueError(f"Binary packet too short: {len(data)} bytes")
+    magic, version, flags, device_id, seq, count, mask = BINARY_HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC:
+        raise ValueError("Not a binary sensor packet")
+    if version not in (BINARY_VERSION, BINARY_CLOCK_VERSION):
+        raise ValueError(f"Unsupported binary packet version {version}")
+    offset = BINARY_HEADER.size
+    clock = None
+    if version == BINARY_CLOCK_VERSION:
+        if len(data) < offset + BINARY_CLOCK.size:
+            raise ValueError(f"Binary packet too short: {len(data)} bytes")
+        clock = checked_clock(*BINARY_CLOCK.unpack_from(data, offset)) # a bad rate falls back to arrival times
+        offset += BINARY_CLOCK.size
+    keys = [key for bit, key in enumerate(BINARY_KEYS) if mask & (1 << bit)]
+    expected = offset + 2 * count * len(keys)
+    if len(data) < expected:
+        raise ValueError(f"Binary packet truncated: {len(data)} of {expected} bytes")
+    samples = np.frombuffer(data, dtype='<i2', count=count * len(keys), offset=offset)
+    samples = samples.reshape(len(keys), count)
+    return device_name(device_id), seq, {key: samples[i] for i, key in enumerate(keys)}, clock
+
+def encode_binary_packet(device_id, seq, columns, clock=None):
+    """Build a packet from a dict of key -> int sequence, for test senders. clock is (device time ms, rate)"""
+    keys = [key for key in BINARY_KEYS if key in columns]
+    count = len(columns[keys[0]]) if keys else 0
+    mask = sum(1 << BINARY_KEYS.index(key) for key in keys)
+    version = BINARY_VERSION if clock is None else BINARY_CLOCK_VERSION
+    header = BINARY_HEADER.pack(BINARY_MAGIC, version, 0, device_id, seq & 0xffffffff, count, mask)
+    if clock is not None:
+        header += BINARY_CLOCK.pack(int(clock[0]) & 0xffffffff, clock[1])
+    body = b"".join(np.asarray(columns[key], dtype='<i2').tobytes() for key in keys)
+    return header + body
+
+# Audio datagrams on port 6001 may start with an 8 byte header:
+#
+#   offset  size  field
+#   0       4     magic b"ECAU"
+#   4       4     sequence number, uint32, +1 per datagram
+#   8       ...   little-endian int16 samples
+#
+# Datagrams without it are taken as bare samples, as before.
+AUDIO_MAGIC = b"ECAU"
+AUDIO_HEADER = struct.Struct("<4sI")
+
+def is_audio_packet(data):
+    """True for an audio datagram with a sequence header"""
+    return len(data) >= AUDIO_HEADER.size and bytes(data[:4]) == AUDIO_MAGIC
+
+def decode_audio_packet(data):
+    """
+    Split a sequenced audio datagram.
+
+    Returns:
+        Tuple of (sequence number, int16 array view of the samples)
+    """
+    magic, seq = AUDIO_HEADER.unpack_from(data)
+    count = (len(data) - AUDIO_HEADER.size) // 2
+    return seq, np.frombuffer(data, dtype='<i2', count=count, offset=AUDIO_HEADER.size)
+
+def encode_audio_packet(seq, samples):
+    """Build a sequenced audio datagram, for test senders"""
+    return AUDIO_HEADER.pack(AUDIO_MAGIC, seq & 0xffffffff) + np.asarray(samples, dtype='<i2').tobytes()
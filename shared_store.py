@@ -0,0 +1,320 @@
+import asyncio
+import signal
+import threading
+import time
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory, resource_tracker
+import database
+from database import SENSOR_COLUMNS, AUDIO_COLUMNS, VIBRATION_COLUMNS, ROLLUP_TIERS, DEFAULT_DEVICE
+from div import log_setup, log
+
+# Columnar ring in shared memory, so ingestion can run in its own process
+# (`python shared_store.py`) and the web process reads the data without any
+# serialization in between. One writer, any number of readers.
+SHARED_STORE_NAME = "echo_store"
+SHARED_MAX_DEVICES = 16 # device partitions in the segment
+SHARED_ROWS = 32768 # raw rows kept per device and channel
+SEQLOCK_RETRIES = 100 # reads that may collide with a write before giving up
+REATTACH_INTERVAL = 1.0 # seconds between reader checks for a segment recreated by a restarted writer
+NAME_BYTES = 64
+_MAGIC = 0x4543484f # "ECHO"
+_LAYOUT_VERSION = 2
+_HEADER = 8 # int64: magic, layout version, max devices, rows, generation, instance, unused...
+_GENERATION = 4
+_INSTANCE = 5 # creation time of the segment, tells readers a restarted writer replaced it
+_CHANNELS = [('sensor', SENSOR_COLUMNS[1:]), ('audio', AUDIO_COLUMNS[1:]), ('vibration', VIBRATION_COLUMNS[1:])]
+_TABLES = [table for table, values in _CHANNELS]
+
+def _segment_size(max_devices, rows):
+    per_channel = sum(16 + 2 * rows * 8 * (1 + len(values)) for table, values in _CHANNELS)
+    return _HEADER * 8 + max_devices * NAME_BYTES + max_devices * per_channel
+
+class SharedStore:
+    """
+    Raw sensor, audio and vibration feature rows per device in a multiprocessing.shared_memory segment.
+
+    Each device and channel is a ring in the RingBuffer layout (rows written
+    twice, so the retained rows are one contiguous slice) guarded by a
+    seqlock: the writer makes the sequence odd, writes, then makes it even.
+    Readers never lock. They copy just the requested window out of the
+    segment (a memcpy, nothing is parsed) and retry if the sequence moved
+    while they were copying. Writes from the receiver threads are serialized
+    by a lock. A writer that restarts creates a new segment under the same
+    name; readers notice within REATTACH_INTERVAL and map the new one.
+    """
+    def __init__(self, name=SHARED_STORE_NAME, create=False, max_devices=SHARED_MAX_DEVICES, rows=SHARED_ROWS):
+        self.name = name
+        self.create = create
+        self.dropped_rows = 0
+        self._shm = None
+        self._slots = {} # device -> slot
+        self._lock = threading.Lock() # one writing thread at a time
+        self._checked = 0.0 # monotonic time of the last check for a recreated segment
+        self._retired = [] # replaced mappings that a reader was still using
+        if create:
+            try: # left behind by a writer that didn't shut down cleanly
+                stale = shared_memory.SharedMemory(name)
+                stale.close()
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+            self._shm = shared_memory.SharedMemory(name, create=True, size=_segment_size(max_devices, rows))
+            header = np.ndarray(_HEADER, dtype=np.int64, buffer=self._shm.buf)
+            header[:] = 0
+            header[:4] = [_MAGIC, _LAYOUT_VERSION, max_devices, rows]
+            header[_INSTANCE] = time.time_ns()
+            self._map()
+            for slot in range(self.max_devices):
+                self._names[slot] = 0
+                for meta, timestamps, values in self._rings[slot]:
+                    meta[:] = 0
+            log(f"Created shared store {name}, {self._shm.size // 2**20} MiB")
+        else:
+            self._attach()
+
+    def _attach(self):
+        """
+        Map a segment created by the writer, False while there is none yet.
+
+        Once mapped, checks at most every REATTACH_INTERVAL whether the name
+        now belongs to a new segment and moves over to it.
+        """
+        if self._shm is not None and (self.create or time.monotonic() - self._checked < REATTACH_INTERVAL):
+            return True
+        self._checked = time.monotonic()
+        self._release()
+        try:
+            shm = shared_memory.SharedMemory(self.name)
+        except FileNotFoundError: # writer gone, the old mapping still holds its last data
+            return self._shm is not None
+        # readers must not unlink the writer's segment when they exit
+        resource_tracker.unregister(shm._name, "shared_memory")
+        magic, version, instance = (int(value) for value in np.ndarray(_HEADER, dtype=np.int64, buffer=shm.buf)[[0, 1, _INSTANCE]])
+        if self._shm is not None and instance == int(self._header[_INSTANCE]):
+            shm.close()
+            return True
+        if magic != _MAGIC or version != _LAYOUT_VERSION:
+            shm.close()
+            raise ValueError(f"Shared store {self.name} has an unknown layout")
+        if self._shm is not None:
+            log(f"Shared store {self.name} was recreated, attaching to the new segment")
+            self._retired.append(self._shm)
+        self._shm = shm
+        self._slots = {}
+        self._map()
+        return True
+
+    def _release(self):
+        """Unmap replaced segments once no read in another thread holds views of them"""
+        for shm in list(self._retired):
+            try:
+                shm.close()
+                self._retired.remove(shm)
+            except BufferError: # a read in another thread still has views, try again next time
+                pass
+
+    def _map(self):
+        buf = self._shm.buf
+        self._header = np.ndarray(_HEADER, dtype=np.int64, buffer=buf)
+        self.max_devices, self.rows = int(self._header[2]), int(self._header[3])
+        offset = _HEADER * 8
+        self._names = np.ndarray((self.max_devices, NAME_BYTES), dtype=np.uint8, buffer=buf, offset=offset)
+        offset += self.max_devices * NAME_BYTES
+        self._rings = []
+        for slot in range(self.max_devices):
+            channels = []
+            for table, values in _CHANNELS:
+                meta = np.ndarray(2, dtype=np.int64, buffer=buf, offset=offset) # seq, rows written
+                offset += 16
+                timestamps = np.ndarray(2 * self.rows, dtype=np.int64, buffer=buf, offset=offset)
+                offset += 2 * self.rows * 8
+                arrays = {}
+                for col in values:
+                    arrays[col] = np.ndarray(2 * self.rows, dtype=np.float64, buffer=buf, offset=offset)
+                    offset += 2 * self.rows * 8
+                channels.append((meta, timestamps, arrays))
+            self._rings.append(channels)
+
+    def _slot_name(self, slot):
+        return bytes(self._names[slot]).rstrip(b"\0").decode("utf-8", "ignore")
+
+    def _slot(self, device, create=False):
+        device = device.encode("utf-8")[:NAME_BYTES].decode("utf-8", "ignore") # as stored in the segment
+        slot = self._slots.get(device)
+        if slot is not None and self._slot_name(slot) == device: # rename() may have given the slot another name
+            return slot
+        self._slots.pop(device, None)
+        for slot in range(self.max_devices): # refresh, the writer may have added devices
+            name = self._slot_name(slot)
+            if name:
+                self._slots[name] = slot
+            elif create:
+                encoded = device.encode("utf-8")[:NAME_BYTES]
+                self._names[slot, :len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+                self._slots[device] = slot
+                return slot
+            else:
+                break
+        return self._slots.get(device)
+
+    def write(self, channel, timestamps, columns, device=DEFAULT_DEVICE):
+        """Append a block of rows, same signature as a database listener"""
+        with self._lock: # receiver threads must not take the same slot or interleave counter updates
+            self._write(channel, timestamps, columns, device)
+
+    def _write(self, channel, timestamps, columns, device):
+        n = len(timestamps)
+        slot = self._slot(device, create=True)
+        if slot is None: # no free partition
+            self.dropped_rows += n
+            return
+        meta, ring_timestamps, arrays = self._rings[slot][_TABLES.index(channel)]
+        timestamps = np.asarray(timestamps, dtype='datetime64[ns]').view(np.int64)
+        if n > self.rows: # only the newest rows fit
+            timestamps = timestamps[-self.rows:]
+            columns = {col: values[-self.rows:] for col, values in columns.items()}
+            self.dropped_rows += n - self.rows
+            n = self.rows
+        total = int(meta[1])
+        idx = (total + np.arange(n)) % self.rows
+        meta[0] += 1 # odd: write in progress
+        ring_timestamps[idx] = ring_timestamps[idx + self.rows] = timestamps
+        for col, array in arrays.items():
+            values = columns.get(col)
+            array[idx] = array[idx + self.rows] = np.nan if values is None else values
+        meta[1] = total + n
+        meta[0] += 1
+        self._header[_GENERATION] += 1
+
+    def rename(self, old, new):
+        """Give old's slot the name new, same signature as a database rename listener"""
+        with self._lock:
+            slot = self._slot(old)
+            if slot is None or self._slot(new) is not None: # new keeps its own slot, old's rows stay under old
+                return
+            encoded = new.encode("utf-8")[:NAME_BYTES]
+            self._names[slot] = 0
+            self._names[slot, :len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+            self._slots.clear() # looked up again from the names
+
+    def generation(self):
+        """Counter that changes with every write"""
+        if not self._attach():
+            return 0
+        return int(self._header[_GENERATION])
+
+    def devices(self):
+        if not self._attach():
+            return []
+        return sorted(name for name in (self._slot_name(slot) for slot in range(self.max_devices)) if name)
+
+    def _read(self, slot, channel, cutoff, columns):
+        """Consistent copy of one channel's rows since cutoff, taken under the seqlock"""
+        meta, ring_timestamps, arrays = self._rings[slot][channel]
+        for attempt in range(SEQLOCK_RETRIES):
+            seq = int(meta[0])
+            if seq & 1: # writer is busy
+                time.sleep(0)
+                continue
+            total = int(meta[1])
+            end = total % self.rows + self.rows
+            start = end - min(total, self.rows)
+            rows = {'timestamp': ring_timestamps[start:end].copy()}
+            for col in columns:
+                rows[col] = arrays[col][start:end].copy()
+            if int(meta[0]) == seq: # nothing was written meanwhile
+                keep = rows['timestamp'] >= cutoff # rows are in arrival order, late packets are not sorted
+                return {col: values[keep] for col, values in rows.items()}
+        raise RuntimeError(f"Shared store kept changing while reading {self._slot_name(slot)}")
+
+    def _buckets(self, slot, channel, cutoff, resolution, columns):
+        """Bucket means of one channel since cutoff"""
+        rows = self._read(slot, channel, cutoff, columns)
+        buckets, inverse = np.unique(rows['timestamp'] // resolution, return_inverse=True)
+        result = {'timestamp': (buckets * resolution).view('datetime64[ns]')}
+        for col in columns:
+            values = rows[col]
+            valid = ~np.isnan(values)
+            sums = np.bincount(inverse, weights=np.where(valid, values, 0.0), minlength=len(buckets))
+            counts = np.bincount(inverse, weights=valid, minlength=len(buckets))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result[col] = sums / counts
+        return result
+
+    def recent_data(self, minutes=5, max_points=None, columns=None, device=DEFAULT_DEVICE):
+        """Same frame as database.recent_data, built from the raw rows in shared memory"""
+        columns = database.COLUMNS[1:] if columns is None else [col for col in columns if col != 'timestamp']
+        empty = pd.DataFrame(columns=['timestamp'] + columns)
+        if not self._attach():
+            return empty
+        slot = self._slot(device)
+        if slot is None:
+            return empty
+        span = pd.Timedelta(minutes=minutes).value
+        resolution = pd.Timedelta(ROLLUP_TIERS[-1][0]).value
+        for tier_resolution, capacity in ROLLUP_TIERS: # finest resolution that fits max_points
+            if max_points is None or span / pd.Timedelta(tier_resolution).value <= max_points:
+                resolution = pd.Timedelta(tier_resolution).value
+                break
+        cutoff = (pd.Timestamp.now() - pd.Timedelta(minutes=minutes)).value
+        df = None
+        for channel, (table, values) in enumerate(_CHANNELS):
+            wanted = [col for col in columns if col in values]
+            if not wanted:
+                continue
+            frame = pd.DataFrame(self._buckets(slot, channel, cutoff, resolution, wanted))
+            df = frame if df is None else pd.merge(df, frame, on='timestamp', how='outer', sort=True)
+        if df is None:
+            return empty
+        return df.reindex(columns=['timestamp'] + columns)
+
+    def stats(self):
+        return {"name": self.name, "attached": self._shm is not None,
+                "devices": self.devices(), "dropped_rows": self.dropped_rows}
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._header = self._names = self._rings = None # views must go before the mapping
+        self._release()
+        self._shm.close()
+        if self.create:
+            self._shm.unlink()
+        self._shm = None
+
+def main():
+    """Ingest process: receive UDP, keep storage and publish everything to the shared store"""
+    import data_process
+    import workers
+    from UDP_recieve import start_udp_receivers
+    log_setup()
+    store = SharedStore(create=True)
+    database.open_storage()
+    database.add_listener(store.write)
+    database.add_rename_listener(store.rename)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        data_process.start_devices(loop)
+        if workers.INGEST_WORKERS > 0:
+            receivers = [workers.IngestWorkers(workers.INGEST_WORKERS).start()]
+        else:
+            receivers = await start_udp_receivers()
+        log(f"Ingesting into shared store {store.name}")
+        await stop.wait()
+        for receiver in receivers:
+            receiver.close()
+        data_process.stop_devices()
+
+    try:
+        asyncio.run(run())
+    finally:
+        database.close_storage()
+        store.close()
+
+if __name__ == "__main__":
+    main()
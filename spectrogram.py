@@ -0,0 +1,134 @@
+import threading
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from audio import level_db
+
+SPECTROGRAM_FRAME = 4096 # samples per STFT frame, 7.8 Hz bins at 32018 Hz
+SPECTROGRAM_HOP = 2048 # half overlapping frames, about 16 per second
+SPECTROGRAM_SECONDS = 300 # rows kept per device, matches the dashboard window
+A_WEIGHTING = True # weight the bands like a sound level meter (dBA)
+# nominal 1/3-octave centre frequencies are 1000 * 2**(k/3), 63 Hz to 12.5 kHz
+OCTAVE_BANDS = np.arange(-12, 12)
+BAND_LABELS = ["63", "80", "100", "125", "160", "200", "250", "315", "400", "500", "630", "800",
+               "1k", "1.25k", "1.6k", "2k", "2.5k", "3.15k", "4k", "5k", "6.3k", "8k", "10k", "12.5k"]
+
+def a_weighting_db(freqs):
+    """IEC 61672 A-weighting in dB for an array of frequencies in Hz"""
+    f2 = np.asarray(freqs, dtype=np.float64) ** 2
+    with np.errstate(divide='ignore'):
+        ra = (12194.0**2 * f2**2) / ((f2 + 20.6**2) * np.sqrt((f2 + 107.7**2) * (f2 + 737.9**2)) * (f2 + 12194.0**2))
+        return 20 * np.log10(ra) + 2.0
+
+class Spectrogram:
+    """
+    Streaming 1/3-octave spectrogram of one audio stream.
+
+    Each chunk is appended to the samples left over from the previous one
+    and every complete frame is taken at once as a 2D strided view, Hann
+    windowed and transformed with one rfft. A (bins x bands) matrix, with the
+    A-weighting folded in, sums the bin powers into bands in one matrix
+    product. Rows of band levels in dBFS go to a ring in the RingBuffer
+    layout, so the newest rows are always one contiguous slice. Rows are
+    computed once at ingest and read by every viewer; `version` changes
+    with each new row.
+    """
+    def __init__(self, sample_rate, frame=SPECTROGRAM_FRAME, hop=SPECTROGRAM_HOP,
+                 seconds=SPECTROGRAM_SECONDS, a_weighting=A_WEIGHTING):
+        self.sample_rate = sample_rate
+        self.frame = frame
+        self.hop = hop
+        self.a_weighting = a_weighting
+        self.capacity = max(1, int(seconds * sample_rate / hop))
+        self.version = 0
+        self.frames = 0
+        self._carry = np.zeros(0, dtype=np.float64) # samples not yet in a complete frame
+        self._taper = np.hanning(frame)
+        freqs = np.fft.rfftfreq(frame, 1 / sample_rate)
+        centres = 1000.0 * 2.0 ** (OCTAVE_BANDS / 3)
+        low, high = centres * 2 ** (-1 / 6), centres * 2 ** (1 / 6)
+        bands = ((freqs[:, None] >= low) & (freqs[:, None] < high)).astype(np.float64)
+        # one-sided power per bin, scaled so the bins of a frame add up to its mean square
+        weight = np.full(len(freqs), 2.0 / (frame * (self._taper ** 2).sum()))
+        if a_weighting:
+            weight *= 10 ** (np.nan_to_num(a_weighting_db(freqs), neginf=-400.0) / 10)
+        self._bands = bands * weight[:, None]
+        self._empty = bands.sum(axis=0) == 0 # bands narrower than a bin stay NaN
+        self._times = np.zeros(2 * self.capacity, dtype='datetime64[ns]')
+        self._levels = np.full((2 * self.capacity, len(centres)), np.nan, dtype=np.float32)
+        self._head = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def process(self, samples, time):
+        """
+        Feed a chunk of int16 samples whose last sample arrived at time (datetime64).
+
+        Returns:
+            Number of spectrogram rows added
+        """
+        times, levels = self.analyze(samples, time)
+        self.add_rows(times, levels)
+        return len(times)
+
+    def analyze(self, samples, time):
+        """
+        Rows of the frames a chunk completes, without adding them, e.g. in an ingest worker.
+
+        Returns:
+            Tuple of (datetime64 array, float32 array of levels with one column per band)
+        """
+        data = np.concatenate((self._carry, np.asarray(samples, dtype=np.float64)))
+        count = 0 if len(data) < self.frame else (len(data) - self.frame) // self.hop + 1
+        if count == 0:
+            self._carry = data
+            return np.zeros(0, dtype='datetime64[ns]'), np.zeros((0, len(OCTAVE_BANDS)), dtype=np.float32)
+        frames = sliding_window_view(data, self.frame)[::self.hop][:count]
+        power = np.abs(np.fft.rfft(frames * self._taper, axis=1)) ** 2
+        levels = level_db(power @ self._bands)
+        levels[:, self._empty] = np.nan
+        ends = np.arange(count) * self.hop + self.frame # frame end within data
+        delay_ns = (len(data) - ends) * (1e9 / self.sample_rate)
+        times = np.datetime64(time, 'ns') - delay_ns.astype('timedelta64[ns]')
+        self._carry = data[count * self.hop:]
+        return times, levels.astype(np.float32)
+
+    def add_rows(self, times, levels):
+        """Append rows made by analyze(), here or in another process"""
+        n = len(times)
+        if n == 0:
+            return
+        self.frames += n
+        if n > self.capacity:
+            times, levels, n = times[-self.capacity:], levels[-self.capacity:], self.capacity
+        idx = (self._head + np.arange(n)) % self.capacity
+        with self._lock:
+            self._times[idx] = self._times[idx + self.capacity] = times
+            self._levels[idx] = self._levels[idx + self.capacity] = levels
+            self._head = (self._head + n) % self.capacity
+            self._size = min(self._size + n, self.capacity)
+            self.version += 1
+
+    def recent(self, seconds=SPECTROGRAM_SECONDS, max_columns=None):
+        """
+        Copy of the rows from the last seconds, averaged (in power) down to max_columns rows.
+
+        Returns:
+            Tuple of (datetime64 array, float array of levels with one column per band)
+        """
+        with self._lock:
+            end = self._head + self.capacity
+            times = self._times[end - self._size:end]
+            start = int(np.searchsorted(times, times[-1] - np.timedelta64(int(seconds * 1e9), 'ns'))) if self._size else 0
+            times = times[start:].copy()
+            levels = self._levels[end - self._size + start:end].astype(np.float64)
+        if max_columns is None or len(times) <= max_columns:
+            return times, levels
+        groups = -(-len(times) // max_columns) # rows per column, rounded up
+        usable = len(times) // groups * groups
+        times, levels = times[-usable:], levels[-usable:]
+        power = (10 ** (levels / 10)).reshape(-1, groups, levels.shape[1]).mean(axis=1)
+        with np.errstate(divide='ignore'):
+            return times[groups - 1::groups], 10 * np.log10(power)
+
+    def stats(self):
+        return {"frames": self.frames, "rows": self._size, "a_weighting": self.a_weighting}
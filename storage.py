@@ -0,0 +1,199 @@
+import queue
+import sqlite3
+import threading
+import time
+import numpy as np
+import pandas as pd
+from div import log
+
+STORAGE_FILE = "sensor_data.db"
+RETENTION_DAYS = 30 # rows older than this are deleted
+FLUSH_INTERVAL = 1.0 # seconds between batched inserts
+PRUNE_INTERVAL = 3600 # seconds between retention passes
+STORAGE_QUEUE_SIZE = 10000 # blocks waiting for the writer before new ones are dropped
+DEFAULT_DEVICE = "default" # partition for rows that don't name a device
+
+class MemoryBackend:
+    """No persistence, the in-memory store is all there is"""
+    def append(self, table, timestamps, columns, device=DEFAULT_DEVICE):
+        pass
+
+    def read_rollup(self, table, columns, start, end, resolution, device=DEFAULT_DEVICE):
+        return None
+
+    def devices(self):
+        return []
+
+    def rename_device(self, old, new):
+        pass
+
+    def stats(self):
+        return {"backend": "memory"}
+
+    def close(self):
+        pass
+
+class SQLiteBackend:
+    """
+    Append-only SQLite storage in WAL mode.
+
+    append() only queues the block; a writer thread inserts everything
+    queued in one transaction every FLUSH_INTERVAL seconds and deletes rows
+    older than retention_days. Each table has one INTEGER timestamp column
+    (ns since epoch), a TEXT device column indexed together with the
+    timestamp, plus one REAL column per value.
+    """
+    def __init__(self, tables, path=STORAGE_FILE, retention_days=RETENTION_DAYS,
+                 flush_interval=FLUSH_INTERVAL, queue_size=STORAGE_QUEUE_SIZE):
+        self.tables = {table: [col for col in columns if col != 'timestamp'] for table, columns in tables.items()}
+        self.path = path
+        self.retention_days = retention_days
+        self.flush_interval = flush_interval
+        self.written_rows = 0
+        self.dropped = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._renames = queue.SimpleQueue() # (old, new) device names, applied after the rows queued before them
+        self._stop = threading.Event()
+        self._create_tables()
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL") # durable at checkpoints, no fsync per commit
+        return conn
+
+    def _create_tables(self):
+        conn = self._connect()
+        with conn:
+            for table, columns in self.tables.items():
+                fields = ", ".join(f'"{col}" REAL' for col in columns)
+                conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (timestamp INTEGER NOT NULL, {fields})')
+                existing = [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+                if 'device' not in existing: # files written before rows were partitioned by device
+                    conn.execute(f'ALTER TABLE "{table}" ADD COLUMN device TEXT NOT NULL DEFAULT \'{DEFAULT_DEVICE}\'')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_timestamp" ON "{table}" (timestamp)')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_device_timestamp" ON "{table}" (device, timestamp)')
+        conn.close()
+
+    def append(self, table, timestamps, columns, device=DEFAULT_DEVICE):
+        """Queue a block of rows, never blocks"""
+        try:
+            self._queue.put_nowait((table, timestamps, columns, device))
+        except queue.Full:
+            self.dropped += len(timestamps)
+
+    def _run(self):
+        conn = self._connect()
+        last_prune = 0
+        while not self._stop.is_set():
+            self._stop.wait(self.flush_interval)
+            try:
+                self._flush(conn)
+                if time.time() - last_prune >= PRUNE_INTERVAL:
+                    self._prune(conn)
+                    last_prune = time.time()
+            except Exception as e:
+                self.errors += 1
+                log(f"Error writing to {self.path}: {str(e)}")
+        try:
+            self._flush(conn)
+        finally:
+            conn.close()
+
+    def rename_device(self, old, new):
+        """Queue renaming a device's rows, done by the writer after the rows already queued"""
+        self._renames.put((old, new))
+
+    def _flush(self, conn):
+        renames = []
+        while not self._renames.empty(): # before the rows, so every row queued under old is in this flush
+            renames.append(self._renames.get_nowait())
+        rows = {}
+        while True:
+            try:
+                table, timestamps, columns, device = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            values = [np.asarray(timestamps, dtype='datetime64[ns]').view(np.int64).tolist(), [device] * len(timestamps)]
+            for col in self.tables[table]:
+                column = columns.get(col)
+                values.append([None] * len(timestamps) if column is None else
+                              np.where(np.isnan(column), None, column).tolist())
+            rows.setdefault(table, []).extend(zip(*values))
+        if not rows and not renames:
+            return
+        with conn:
+            for table, table_rows in rows.items():
+                fields = ", ".join(["timestamp", "device"] + [f'"{col}"' for col in self.tables[table]])
+                placeholders = ", ".join("?" * (len(self.tables[table]) + 2))
+                conn.executemany(f'INSERT INTO "{table}" ({fields}) VALUES ({placeholders})', table_rows)
+                self.written_rows += len(table_rows)
+            for old, new in renames:
+                for table in self.tables:
+                    conn.execute(f'UPDATE "{table}" SET device = ? WHERE device = ?', (new, old))
+
+    def _prune(self, conn):
+        cutoff = (pd.Timestamp.now() - pd.Timedelta(days=self.retention_days)).value
+        with conn:
+            for table in self.tables:
+                conn.execute(f'DELETE FROM "{table}" WHERE timestamp < ?', (cutoff,))
+
+    def read_rollup(self, table, columns, start, end, resolution, device=DEFAULT_DEVICE):
+        """
+        Sum, count, min and max per column of one device for buckets of resolution ns, computed by SQLite.
+
+        Returns:
+            Dict of arrays: 'timestamp' (bucket start), 'rows' and '<column>_<sum|count|min|max>'
+        """
+        columns = [col for col in columns if col in self.tables[table]]
+        fields = ["timestamp / ? AS bucket", "COUNT(*)"]
+        for col in columns:
+            fields += [f'TOTAL("{col}")', f'COUNT("{col}")', f'MIN("{col}")', f'MAX("{col}")']
+        query = f'SELECT {", ".join(fields)} FROM "{table}" WHERE device = ? AND timestamp >= ?'
+        params = [int(resolution), device, pd.Timestamp(start).value]
+        if end is not None:
+            query += " AND timestamp < ?"
+            params.append(pd.Timestamp(end).value)
+        conn = self._connect()
+        try:
+            rows = conn.execute(query + " GROUP BY bucket ORDER BY bucket", params).fetchall()
+        finally:
+            conn.close()
+        data = np.array(rows, dtype=np.float64).reshape(len(rows), 2 + 4 * len(columns))
+        result = {
+            'timestamp': (data[:, 0].astype(np.int64) * int(resolution)).view('datetime64[ns]'),
+            'rows': data[:, 1]
+        }
+        for i, col in enumerate(columns):
+            for j, agg in enumerate(('sum', 'count', 'min', 'max')):
+                result[f"{col}_{agg}"] = data[:, 2 + 4 * i + j]
+        return result
+
+    def devices(self):
+        """Every device with rows in any table"""
+        conn = self._connect()
+        try:
+            found = set()
+            for table in self.tables:
+                found.update(row[0] for row in conn.execute(f'SELECT DISTINCT device FROM "{table}"'))
+        finally:
+            conn.close()
+        return sorted(found)
+
+    def stats(self):
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "written_rows": self.written_rows,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+            "errors": self.errors
+        }
+
+    def close(self):
+        """Flush what is queued and stop the writer"""
+        self._stop.set()
+        self._thread.join(timeout=10)
@@ -0,0 +1,89 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from database import RingBuffer
+
+VIBRATION_WINDOW = 256 # samples per feature row, 0.26 s at 1 kHz
+VIBRATION_SEGMENT = 64 # Welch segment length, half overlapping, Hann windowed
+VIBRATION_RAW_SAMPLES = 2**18 # raw waveform kept in memory per device
+# band edges as fractions of the Nyquist frequency, so they follow whatever
+# rate the board samples at: Vib_band1 is the lowest eighth of the spectrum
+VIBRATION_BANDS = [(0, 1/8), (1/8, 1/4), (1/4, 1/2), (1/2, 1)]
+
+class VibrationAnalyzer:
+    """
+    Feature rows from the full-rate vibration waveform of one device.
+
+    Samples are collected into windows of VIBRATION_WINDOW. All windows
+    completed by a block are analysed at once as a 2D array: RMS and peak
+    around the window mean, crest factor, and a Welch power spectrum
+    (rfft over every half-overlapping segment of every window) that gives
+    the dominant frequency and the power per band. The band powers add up
+    to about RMS squared. The raw waveform only goes to a bounded ring.
+    """
+    def __init__(self, window=VIBRATION_WINDOW, segment=VIBRATION_SEGMENT, raw_samples=VIBRATION_RAW_SAMPLES):
+        self.window = window
+        self.segment = segment
+        self.raw = RingBuffer(['timestamp', 'Vibration'], raw_samples)
+        self.samples = 0
+        self.windows = 0
+        self._values = np.zeros(0) # samples of the window being filled
+        self._times = np.zeros(0, dtype=np.int64)
+        self._taper = np.hanning(segment)
+        self._scale = 2.0 / (segment * (self._taper ** 2).sum()) # one-sided power per bin
+        fractions = np.arange(segment // 2 + 1) / (segment // 2)
+        self._bands = [(fractions > low) & (fractions <= high) for low, high in VIBRATION_BANDS]
+
+    def process(self, timestamps, values):
+        """
+        Feed a block of samples.
+
+        Returns:
+            Dict of 'timestamp' (end of each window) and the Vib_* feature
+            arrays, one entry per window completed by this block
+        """
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        if not valid.any(): # e.g. a board without a vibration sensor, its raw ring is never allocated
+            return self.features(np.zeros((0, self.window)), np.zeros((0, self.window), dtype=np.int64))
+        timestamps = np.asarray(timestamps, dtype='datetime64[ns]')
+        self.raw.extend({'timestamp': timestamps, 'Vibration': values}, len(values))
+        self.samples += int(valid.sum())
+        self._values = np.concatenate((self._values, values[valid]))
+        self._times = np.concatenate((self._times, timestamps[valid].view(np.int64)))
+        count = len(self._values) // self.window
+        if count == 0:
+            return self.features(np.zeros((0, self.window)), np.zeros((0, self.window), dtype=np.int64))
+        used = count * self.window
+        block = self._values[:used].reshape(count, self.window)
+        times = self._times[:used].reshape(count, self.window)
+        self._values, self._times = self._values[used:], self._times[used:]
+        self.windows += count
+        return self.features(block, times)
+
+    def features(self, block, times):
+        """Vib_* features of each row of block, times holds the sample timestamps in ns"""
+        x = block - block.mean(axis=1, keepdims=True)
+        rms = np.sqrt((x ** 2).mean(axis=1))
+        peak = np.abs(x).max(axis=1, initial=0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            crest = peak / rms
+            rate = (self.window - 1) / ((times[:, -1] - times[:, 0]) / 1e9)
+        segments = sliding_window_view(x, self.segment, axis=1)[:, ::self.segment // 2]
+        segments = segments - segments.mean(axis=2, keepdims=True)
+        power = (np.abs(np.fft.rfft(segments * self._taper, axis=2)) ** 2).mean(axis=1) * self._scale
+        power[:, 0] /= 2 # DC and Nyquist have no mirrored half
+        power[:, -1] /= 2
+        dominant = power[:, 1:].argmax(axis=1) + 1
+        result = {
+            'timestamp': times[:, -1].view('datetime64[ns]'),
+            'Vib_rms': rms,
+            'Vib_peak': peak,
+            'Vib_crest': np.where(rms > 0, crest, np.nan),
+            'Vib_freq': dominant * np.where(np.isfinite(rate), rate, np.nan) / self.segment
+        }
+        for i, band in enumerate(self._bands):
+            result[f'Vib_band{i + 1}'] = power[:, band].sum(axis=1)
+        return result
+
+    def stats(self):
+        return {"samples": self.samples, "windows": self.windows, "raw_rows": len(self.raw)}
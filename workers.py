@@ -0,0 +1,158 @@
+import multiprocessing
+import multiprocessing.connection
+import select
+import threading
+from datetime import datetime
+import numpy as np
+from data_process import (parse_sensor_packet, sensor_rows, store_sensor_rows, audio_chunks, audio_rows,
+                          store_audio_rows, keep_audio, device_for, DeviceState, MAX_DEVICES)
+from UDP_recieve import udp_start_json_socket, udp_start_audio_socket, MAX_DATAGRAM_SIZE, MAX_JSON_DATAGRAM_SIZE
+from div import log_setup, log
+
+# Optional multi-process ingest: N worker processes all bind the UDP ports with
+# SO_REUSEPORT, the kernel spreads the senders over them (one board always lands
+# on the same worker). Workers parse, timestamp and analyse the packets with
+# their own per-sender state (clock, vibration windows, audio reordering,
+# loudness and spectrogram frames) and send the finished rows over a pipe to
+# one collector thread in the server process. The collector only resolves the
+# device, stores the rows and keeps the audio for the WAV writer and the live
+# stream, so the FFTs scale with the workers and stay off the server's GIL.
+INGEST_WORKERS = 0 # worker processes, 0 receives in the server process instead
+WORKER_BATCH_SIZE = 64 # datagrams read per socket before a batch goes to the server
+
+def worker_state(states, key):
+    """The worker's own DeviceState for a sender, the oldest is dropped beyond MAX_DEVICES"""
+    state = states.get(key)
+    if state is None:
+        if len(states) >= MAX_DEVICES:
+            states.pop(next(iter(states)))
+        state = states[key] = DeviceState(key) # never started, only its analysis state is used
+    return state
+
+def worker_main(index, conn, stop):
+    """Receive loop of one worker process"""
+    log_setup()
+    json_sock, _ = udp_start_json_socket(reuse_port=True)
+    audio_sock, _ = udp_start_audio_socket(reuse_port=True)
+    json_sock.setblocking(False)
+    audio_sock.setblocking(False)
+    sensors = {} # device id, or IP for packets without one -> DeviceState
+    audio = {} # IP -> DeviceState, audio packets don't name their device
+    log(f"Ingest worker {index} started")
+    try:
+        while not stop.is_set():
+            readable, _, _ = select.select([json_sock, audio_sock], [], [], 0.5)
+            batch = []
+            for sock in readable:
+                size = MAX_DATAGRAM_SIZE if sock is audio_sock else MAX_JSON_DATAGRAM_SIZE
+                for _ in range(WORKER_BATCH_SIZE):
+                    try:
+                        data, address = sock.recvfrom(size)
+                    except BlockingIOError:
+                        break
+                    try:
+                        now = datetime.now()
+                        if sock is audio_sock:
+                            state = worker_state(audio, address[0])
+                            chunks = []
+                            for chunk in audio_chunks(data, state):
+                                samples = chunk if isinstance(chunk, np.ndarray) else np.frombuffer(chunk, dtype=np.int16, count=len(chunk) // 2)
+                                chunks.append((samples,) + audio_rows(samples, state, np.datetime64(now, 'ns')))
+                            batch.append(("audio", address, chunks))
+                        else:
+                            device_id, columns, seq, clock = parse_sensor_packet(data)
+                            state = worker_state(sensors, device_id or address[0])
+                            state.sensor_sequence(seq) # resets the clock when the board restarted
+                            slow, features = sensor_rows(columns, now, state, clock)
+                            batch.append(("sensor", address, device_id, seq, slow, features))
+                    except Exception as e:
+                        log(f"Error processing {'audio' if sock is audio_sock else 'sensor'} data in worker {index}: {str(e)}")
+            if batch:
+                conn.send(batch) # numpy columns pickle as raw buffers
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
+    finally:
+        json_sock.close()
+        audio_sock.close()
+        conn.close()
+
+class IngestWorkers:
+    """
+    Starts the worker processes and feeds their batches into data_process.
+
+    Has the same name/stats/close interface as the in-process receivers.
+    """
+    def __init__(self, workers=INGEST_WORKERS, name="ingest-workers"):
+        self.name = name
+        self.workers = workers
+        self.batches = 0
+        self.packets = 0
+        self.errors = 0
+        self._context = multiprocessing.get_context("spawn") # no fork of a threaded server
+        self._stop = self._context.Event()
+        self._processes = []
+        self._connections = []
+        self._thread = None
+
+    def start(self):
+        log(f"Starting {self.workers} ingest worker processes")
+        for i in range(self.workers):
+            receiver, sender = self._context.Pipe(duplex=False)
+            process = self._context.Process(target=worker_main, args=(i, sender, self._stop),
+                                            name=f"ingest-{i}", daemon=True)
+            process.start()
+            sender.close() # the worker holds the only write end, EOF when it exits
+            self._processes.append(process)
+            self._connections.append(receiver)
+        self._thread = threading.Thread(target=self._collect, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def _collect(self):
+        connections = list(self._connections)
+        while connections and not self._stop.is_set():
+            for conn in multiprocessing.connection.wait(connections, timeout=0.5):
+                try:
+                    batch = conn.recv()
+                except (EOFError, OSError):
+                    connections.remove(conn)
+                    continue
+                self.batches += 1
+                for item in batch:
+                    self.packets += 1
+                    try:
+                        if item[0] == "sensor":
+                            kind, address, device_id, seq, slow, features = item
+                            device = device_for(address, device_id)
+                            if device is not None:
+                                device.sensor_sequence(seq) # loss and reorder counts for the device stats
+                                store_sensor_rows(device.device_id, slow, features)
+                        else:
+                            kind, address, chunks = item
+                            device = device_for(address)
+                            if device is not None:
+                                for samples, levels, spectrum in chunks:
+                                    keep_audio(samples, device)
+                                    store_audio_rows(device, levels, spectrum)
+                    except Exception as e:
+                        self.errors += 1
+                        log(f"Error in {self.name}: {str(e)}")
+
+    def stats(self):
+        return {
+            "workers": [{"pid": process.pid, "alive": process.is_alive()} for process in self._processes],
+            "batches": self.batches,
+            "packets": self.packets,
+            "errors": self.errors
+        }
+
+    def close(self):
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        for conn in self._connections:
+            conn.close()